@@ -1,5 +1,9 @@
+import collections
+import json
 import numpy as np
 import os
+import re
+import threading
 import xml.etree.ElementTree as ET
 
 def find_line_number_endtag_xdmf(alines):
@@ -8,37 +12,607 @@ def find_line_number_endtag_xdmf(alines):
           return n + 1
     raise ValueError("</Xdmf> not found")
 
+def vector_norm(*components):
+    """ Euclidean norm of the components, computed without temporary arrays """
+    myData = np.hypot(components[0], components[1])
+    for component in components[2:]:
+        np.hypot(myData, component, out=myData)
+    return myData
+
+
+# name -> list of [components, function]: a derived field is computed as
+# function(*components) from the first list of components available in the file
+derived_fields = {}
+
+
+def register_derived_field(name, components, function):
+    """ Register a derived field, computed as function(*arrays of components)
+    when name is not stored but all its components are (see seissolxdmf.ReadData)
+    function is applied to chunks of cells and blocks of time steps (arrays
+    of shape (ncells) or (nsteps, ncells)) and should be elementwise """
+    derived_fields.setdefault(name, []).append([list(components), function])
+
+
+# slip rate, slip and shear traction magnitudes (fault output)
+register_derived_field("SR", ["SRs", "SRd"], vector_norm)
+register_derived_field("Sl", ["Sls", "Sld"], vector_norm)
+register_derived_field("T", ["T_s", "T_d"], vector_norm)
+# velocity and displacement magnitudes (surface and volume outputs),
+# e.g. PGV = ReduceData("v_norm", "max")
+register_derived_field("v_norm", ["v1", "v2", "v3"], vector_norm)
+register_derived_field("v_norm", ["u", "v", "w"], vector_norm)
+register_derived_field("v_horizontal", ["v1", "v2"], vector_norm)
+register_derived_field("v_horizontal", ["u", "v"], vector_norm)
+register_derived_field("u_norm", ["u1", "u2", "u3"], vector_norm)
+
+# state of the worker processes of seissolxdmf.MapDataChunks
+_chunkWorker = {}
+
+
+def _init_chunk_worker(pickledReader, dataNames, kernel, idt):
+    import pickle
+
+    _chunkWorker["reader"] = pickle.loads(pickledReader)
+    _chunkWorker["args"] = (dataNames, kernel, idt)
+
+
+def _run_chunk_worker(chunk):
+    dataNames, kernel, idt = _chunkWorker["args"]
+    firstElement, nchunk = chunk
+    return firstElement, _chunkWorker["reader"].RunChunkKernel(dataNames, kernel, firstElement, nchunk, idt)
+
+class TemporalReduction:
+    """ Incremental reduction over time of per-cell data, using O(ncells) memory
+    reduction: one of TemporalReduction.reductions:
+    - max, min, absmax: extremum over time (NaNs, e.g. of corrupted time steps, are ignored)
+    - argmax, argmin: time step of the extremum
+    - mean: mean over the time steps
+    - integral: time integral (trapezoidal rule), e.g. slip from slip rate
+    - first_crossing: first time at which the data exceeds threshold (NaN if never)
+    steps, times: time steps (and corresponding output times) to be reduced, in order """
+
+    reductions = ["max", "min", "absmax", "argmax", "argmin", "mean", "integral", "first_crossing"]
+
+    def __init__(self, reduction, steps, times, threshold=None):
+        if reduction not in self.reductions:
+            raise ValueError(f"unknown reduction {reduction}, should be one of {self.reductions}")
+        if reduction == "first_crossing" and threshold is None:
+            raise ValueError("first_crossing requires a threshold")
+        self.reduction = reduction
+        self.steps = list(steps)
+        self.times = list(times)
+        self.threshold = threshold
+        self.Reset()
+
+    def Reset(self):
+        self.count = 0
+        self.accumulator = None
+
+    def Update(self, data):
+        """ Reduce the data of the next time step """
+        step = self.steps[self.count]
+        time = self.times[self.count]
+        reduction = self.reduction
+        if self.accumulator is None:
+            if reduction in ["max", "min"]:
+                self.accumulator = np.array(data)
+            elif reduction == "absmax":
+                self.accumulator = np.abs(data)
+                self.buffer = np.empty_like(self.accumulator)
+            elif reduction in ["argmax", "argmin"]:
+                self.extremum = np.array(data)
+                self.accumulator = np.full(data.shape, step, dtype=np.int64)
+            elif reduction == "mean":
+                self.accumulator = np.array(data, dtype=np.float64)
+            elif reduction == "integral":
+                self.accumulator = np.zeros(data.shape, dtype=np.float64)
+                self.previous = np.array(data, dtype=np.float64)
+                self.buffer = np.empty_like(self.previous)
+            else:
+                self.accumulator = np.where(data > self.threshold, time, np.nan)
+        elif reduction == "max":
+            np.fmax(self.accumulator, data, out=self.accumulator)
+        elif reduction == "min":
+            np.fmin(self.accumulator, data, out=self.accumulator)
+        elif reduction == "absmax":
+            np.abs(data, out=self.buffer)
+            np.fmax(self.accumulator, self.buffer, out=self.accumulator)
+        elif reduction in ["argmax", "argmin"]:
+            mask = data > self.extremum if reduction == "argmax" else data < self.extremum
+            np.copyto(self.extremum, data, where=mask)
+            self.accumulator[mask] = step
+        elif reduction == "mean":
+            self.accumulator += data
+        elif reduction == "integral":
+            np.add(self.previous, data, out=self.buffer)
+            self.buffer *= 0.5 * (time - self.times[self.count - 1])
+            self.accumulator += self.buffer
+            self.previous[:] = data
+        else:
+            self.accumulator[np.isnan(self.accumulator) & (data > self.threshold)] = time
+        self.count += 1
+
+    def Result(self):
+        if self.accumulator is None:
+            raise ValueError("no time step was reduced")
+        if self.reduction == "mean":
+            return self.accumulator / self.count
+        return self.accumulator
+
+    def __call__(self, data):
+        """ Reduce all time steps of data of shape (nsteps, ncells)
+        (allows using the reduction as kernel of MapDataChunks) """
+        self.Reset()
+        for row in data:
+            self.Update(row)
+        result = self.Result()
+        self.Reset()
+        return result
+
+
+class LazyDataArray:
+    """ Lazy array-like handle on a data array of a seissolxdmf reader (see seissolxdmf.__getitem__)
+    of shape (ndt, nElements), or (nElements) for data not depending on time (e.g. partition).
+    Indexing (with integers, slices, integer lists/arrays or boolean masks on each axis)
+    only reads the time steps and cells indexed, e.g. sx['SRs'][10:20, cells] """
+
+    def __init__(self, reader, dataName):
+        self.reader = reader
+        self.dataName = dataName
+        derivedField = reader.GetDerivedField(dataName)
+        entry = reader.index["attributes"][derivedField[0][0] if derivedField else dataName]
+        self.timeDependent = entry["timeDependent"]
+        self.shape = (reader.ndt, reader.nElements) if self.timeDependent else (reader.nElements,)
+        self.myDtype = None
+
+    @property
+    def dtype(self):
+        if self.myDtype is None:
+            self.myDtype = np.asarray(self[(0,) * self.ndim]).dtype
+        return self.myDtype
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return f"LazyDataArray({self.dataName!r}, shape={self.shape})"
+
+    def __array__(self, dtype=None, copy=None):
+        myData = np.asarray(self[...])
+        return myData if dtype is None else myData.astype(dtype)
+
+    def NormalizeIndex(self, key, size):
+        """ Convert an index along an axis of length size into
+        an int, a slice with positive step or an array of indices """
+        if isinstance(key, (int, np.integer)):
+            if not -size <= key < size:
+                raise IndexError(f"index {key} is out of bounds for axis with size {size}")
+            return int(key) % size
+        if isinstance(key, slice):
+            start, stop, step = key.indices(size)
+            if step > 0:
+                return slice(start, max(start, stop), step)
+            return np.arange(start, stop, step)
+        key = np.asarray(key)
+        if key.size == 0:
+            key = key.astype(np.int64)
+        if key.dtype == bool:
+            if key.shape != (size,):
+                raise IndexError(f"boolean index of shape {key.shape} does not match axis of size {size}")
+            return np.nonzero(key)[0]
+        if key.ndim != 1 or not np.issubdtype(key.dtype, np.integer):
+            raise IndexError("only integers, slices, 1d integer arrays and boolean masks are valid indices")
+        if key.size and (key.min() < -size or key.max() >= size):
+            raise IndexError(f"index out of bounds for axis with size {size}")
+        return key % size
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            i = [k is Ellipsis for k in key].index(True)
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + key[i + 1 :]
+        if len(key) > self.ndim:
+            raise IndexError(f"too many indices for array of dimension {self.ndim}")
+        key = key + (slice(None),) * (self.ndim - len(key))
+        cells = self.NormalizeIndex(key[-1], self.shape[-1])
+        reader = self.reader
+        if not self.timeDependent:
+            return reader.Read1dData(self.dataName, reader.nElements, isInt=reader.index["attributes"][self.dataName]["numberType"] in ["Int", "UInt"])[cells]
+        steps = self.NormalizeIndex(key[0], self.shape[0])
+        if isinstance(cells, slice) and cells.step == 1:
+            return reader.ReadDataChunk(self.dataName, cells.start, cells.stop - cells.start, steps)
+        if isinstance(cells, slice):
+            cells = np.arange(cells.start, cells.stop, cells.step)
+        if isinstance(cells, int):
+            return reader.ReadDataCells(self.dataName, [cells], steps)[..., 0]
+        return reader.ReadDataCells(self.dataName, cells, steps)
+
+
+class SpatialIndex:
+    """ Uniform grid over points (e.g. cell centroids, see seissolxdmf.GetSpatialIndex),
+    for box, sphere and nearest point queries only visiting the grid bins near the query.
+    The points are sorted by bin (order), the points of bin i being
+    order[binStart[i]:binStart[i + 1]]. Flat axes (e.g. of a planar fault) get a single bin.
+    pointsPerBin: average number of points per bin """
+
+    def __init__(self, points, pointsPerBin=8):
+        points = np.asarray(points, dtype=np.float64)
+        self.points = points
+        npoints, ndim = points.shape
+        self.origin = points.min(axis=0) if npoints else np.zeros(ndim)
+        extent = points.max(axis=0) - self.origin if npoints else np.zeros(ndim)
+        active = extent > 1e-9 * max(1.0, extent.max(initial=0.0))
+        nbins = max(1.0, npoints / pointsPerBin)
+        if active.any():
+            binSize = (np.prod(extent[active]) / nbins) ** (1.0 / np.count_nonzero(active))
+        else:
+            binSize = 1.0
+        self.binSize = np.where(active, binSize, 1.0)
+        self.dims = np.where(active, np.maximum(1, np.ceil(extent / self.binSize)), 1).astype(np.int64)
+        binIds = self.LinearBinIds(self.GetBins(points))
+        self.order = np.argsort(binIds, kind="stable")
+        self.binStart = np.searchsorted(binIds[self.order], np.arange(np.prod(self.dims) + 1))
+
+    def GetBins(self, points):
+        """ Grid coordinates of the bins containing points (clipped to the grid) """
+        bins = np.floor((np.asarray(points, dtype=np.float64) - self.origin) / self.binSize)
+        return np.clip(bins, 0, self.dims - 1).astype(np.int64)
+
+    def LinearBinIds(self, bins):
+        return np.ravel_multi_index(bins.T, self.dims) if bins.size else np.zeros(0, dtype=np.int64)
+
+    def GetBoxCandidates(self, lowerBin, upperBin):
+        """ Ids of the points of the bins lowerBin to upperBin (included) """
+        # the bins along the last axis are contiguous in order
+        axes = [np.arange(lowerBin[i], upperBin[i] + 1) for i in range(len(self.dims) - 1)]
+        rows = np.stack([axis.reshape(-1) for axis in np.meshgrid(*axes, indexing="ij")], axis=-1) if axes else np.zeros((1, 0), dtype=np.int64)
+        first = np.ravel_multi_index(np.column_stack((rows, np.full(len(rows), lowerBin[-1]))).T, self.dims)
+        starts = self.binStart[first]
+        ends = self.binStart[first + upperBin[-1] - lowerBin[-1] + 1]
+        return self.order[concatenate_ranges(starts, ends)]
+
+    def QueryBox(self, lower, upper):
+        """ Sorted ids of the points p with lower < p < upper (component-wise)
+        lower, upper: bounds of the box, -np.inf or np.inf for unbounded axes """
+        lower = np.asarray(lower, dtype=np.float64)
+        upper = np.asarray(upper, dtype=np.float64)
+        if len(self.points) == 0 or np.any(lower >= upper):
+            return np.zeros(0, dtype=np.int64)
+        lowerBin = self.GetBins(lower)
+        upperBin = self.GetBins(upper)
+        ids = self.GetBoxCandidates(lowerBin, upperBin)
+        points = self.points[ids]
+        inside = np.all((points > lower) & (points < upper), axis=1)
+        return np.sort(ids[inside])
+
+    def QuerySphere(self, center, radius):
+        """ Sorted ids of the points at distance <= radius of center """
+        center = np.asarray(center, dtype=np.float64)
+        if len(self.points) == 0 or radius < 0:
+            return np.zeros(0, dtype=np.int64)
+        ids = self.GetBoxCandidates(self.GetBins(center - radius), self.GetBins(center + radius))
+        inside = np.sum((self.points[ids] - center) ** 2, axis=1) <= radius**2
+        return np.sort(ids[inside])
+
+    def QueryNearest(self, points, k=1):
+        """ Ids of the k nearest points of each of points
+        returns an array of shape (len(points)) (k=1) or (len(points), k) """
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        k = min(k, len(self.points))
+        if k < 1:
+            raise ValueError("no point in the spatial index")
+        result = np.empty((len(points), k), dtype=np.int64)
+        for i, point in enumerate(points):
+            center = self.GetBins(point)
+            r = 0
+            while True:
+                lowerBin = np.maximum(center - r, 0)
+                upperBin = np.minimum(center + r, self.dims - 1)
+                ids = self.GetBoxCandidates(lowerBin, upperBin)
+                # the points not yet visited are beyond a face of the box of bins
+                # (not on the boundary of the grid)
+                lowerFace = np.where(lowerBin > 0, point - (self.origin + lowerBin * self.binSize), np.inf)
+                upperFace = np.where(upperBin < self.dims - 1, self.origin + (upperBin + 1) * self.binSize - point, np.inf)
+                bound = max(0.0, min(lowerFace.min(), upperFace.min()))
+                if len(ids) >= k:
+                    distance = np.sum((self.points[ids] - point) ** 2, axis=1)
+                    nearest = np.argpartition(distance, k - 1)[:k]
+                    nearest = nearest[np.argsort(distance[nearest], kind="stable")]
+                    if distance[nearest[-1]] <= bound**2:
+                        result[i] = ids[nearest]
+                        break
+                r += 1
+        return result[:, 0] if k == 1 else result
+
+    def Save(self, filename, key=None):
+        """ Save the index to filename (npz), with an optional key identifying the points """
+        np.savez(filename, points=self.points, origin=self.origin, binSize=self.binSize, dims=self.dims, order=self.order, binStart=self.binStart, key=json.dumps(key))
+
+    @classmethod
+    def Load(cls, filename, key=None):
+        """ Load an index saved with Save, returns None if the file
+        cannot be read or if its key differs from key """
+        try:
+            with np.load(filename) as data:
+                if json.loads(str(data["key"])) != key:
+                    return None
+                index = cls.__new__(cls)
+                for name in ["points", "origin", "binSize", "dims", "order", "binStart"]:
+                    setattr(index, name, data[name])
+                return index
+        except (OSError, ValueError, KeyError):
+            return None
+
+
+def concatenate_ranges(starts, ends):
+    """ Concatenation of the ranges [starts[i], ends[i]) """
+    lengths = ends - starts
+    offsets = np.cumsum(lengths) - lengths
+    return np.arange(lengths.sum()) - np.repeat(offsets - starts, lengths)
+
+
+class StationInterpolator:
+    """ Linear map from the data of a few cells to values at stations (see seissolxdmf.GetStationInterpolator)
+    value[station] = sum(weights[i] * data[columns[i]] for i with rows[i] == station)
+    cells: sorted ids of the cells to read, columns indexing into cells """
+
+    def __init__(self, cells, rows, columns, weights, nstations):
+        self.cells = cells
+        self.rows = rows
+        self.columns = columns
+        self.weights = weights
+        self.nstations = nstations
+        # rows are sorted, each station having at least a weight
+        self.rowStart = np.searchsorted(rows, np.arange(nstations))
+
+    def Apply(self, data):
+        """ Map data of shape (..., len(cells)) to an array of shape (..., nstations) """
+        return np.add.reduceat(data[..., self.columns] * self.weights, self.rowStart, axis=-1)
+
+
 class seissolxdmf:
-    def __init__(self, xdmfFilename):
+    metadataCacheVersion = 2
+
+    def __init__(self, xdmfFilename, maxOpenFiles=8, chunkCacheSize=None, useMemmap=False, metadataCache=False, cacheSize=0):
+        """ maxOpenFiles: number of hdf5 files kept open between reads
+        chunkCacheSize: size in bytes of the hdf5 chunk cache of each open file
+        (None for the h5py default)
+        useMemmap: map binary (posix) files in memory, reads then return
+        read-only views of the files instead of copies
+        metadataCache: if True (or a filename), the parsed metadata are stored in
+        a sidecar file (by default xdmfFilename.seissolxdmf.json), and loaded
+        instead of parsing the xdmf file as long as the xdmf file is unchanged
+        cacheSize: if > 0, size in bytes of a LRU cache of the data read by
+        ReadData, ReadDataChunk and ReadDataCells. The arrays returned are then
+        read-only, as they may be shared between calls """
         self.xdmfFilename = xdmfFilename
-        with open (xdmfFilename, "r") as fid:
-            lines=fid.readlines()
-        # Remove potential extra content at the end of the file
-        nlines = find_line_number_endtag_xdmf(lines)
-        if nlines!=len(lines):
-            print(f'Warning: extra content at the end of {xdmfFilename} detected')
-        file_txt = ' '.join([line for line in lines[0:nlines]])
-        self.tree = ET.ElementTree(ET.fromstring(file_txt))
+        self.maxOpenFiles = max(1, maxOpenFiles)
+        self.chunkCacheSize = chunkCacheSize
+        self.useMemmap = useMemmap
+        self.cacheSize = cacheSize
+        self.InitPools()
+        self.xdmfTree = None
+        if metadataCache:
+            self.metadataCacheFilename = metadataCache if isinstance(metadataCache, str) else f"{xdmfFilename}.seissolxdmf.json"
+            if not self.LoadMetadataCache():
+                self.ParseXdmf()
+                self.WriteMetadataCache()
+        else:
+            self.ParseXdmf()
         self.ndt = self.ReadNdt()
         self.nElements = self.ReadNElements()
 
-    def ReadHdf5DatasetChunk(self, absolute_path, hdf5var, firstElement, nchunk, idt=-1):
-        """ Read block of data in hdf5 format
-        idt!=-1 loads only one time step """
-        import h5py
+    @property
+    def tree(self):
+        """ ElementTree of the xdmf file, restricted to its first time step
+        (parsed on first access if the metadata were loaded from the cache) """
+        if self.xdmfTree is None:
+            self.ParseXdmf()
+        return self.xdmfTree
 
+    def InitPools(self):
+        """ Initialize the (empty) pools of open files """
+        # absolute_path -> [h5py.File, {hdf5var: h5py.Dataset}], least recently used first
+        self.hdf5Pool = collections.OrderedDict()
+        # absolute_path -> np.memmap of shape (nrows, MemDimension)
+        self.memmapPool = {}
+        # the pools are shared with the reading thread of IterTimeSteps
+        self.poolLock = threading.RLock()
+        self.ClearCache()
+
+    def __getstate__(self):
+        """ Open files are not pickled: an unpickled reader (e.g. in a worker
+        process of MapDataChunks) reopens its own files, without reparsing the xdmf file """
+        state = dict(self.__dict__)
+        for key in ["hdf5Pool", "memmapPool", "poolLock", "xdmfTree", "cache", "cacheBytes", "cacheHits", "cacheMisses"]:
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.InitPools()
+        self.xdmfTree = None
+
+    def __getitem__(self, dataName):
+        """ Return a lazy array-like handle on the data array named 'dataName' (see LazyDataArray) """
+        self.GetDataLocationPrecisionMemDimension(dataName)
+        return LazyDataArray(self, dataName)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """ Close all hdf5 files and memory maps kept open by the reader """
+        with self.poolLock:
+            self.memmapPool.clear()
+            while self.hdf5Pool:
+                h5f, datasets = self.hdf5Pool.popitem(last=False)[1]
+                datasets.clear()
+                h5f.close()
+
+    def ClearCache(self):
+        """ Empty the cache of data arrays (see cacheSize) and reset its statistics """
+        with self.poolLock:
+            # key -> read-only array, least recently used first
+            self.cache = collections.OrderedDict()
+            self.cacheBytes = 0
+            self.cacheHits = 0
+            self.cacheMisses = 0
+
+    def GetCacheStatistics(self):
+        """ Return the statistics of the cache of data arrays (see cacheSize) """
+        with self.poolLock:
+            return {"hits": self.cacheHits, "misses": self.cacheMisses, "entries": len(self.cache), "bytes": self.cacheBytes, "cacheSize": self.cacheSize}
+
+    def GetCachedData(self, key, read):
+        """ Return the array cached for key, or read it with read() and cache it
+        The least recently used arrays are evicted to keep the cache below cacheSize bytes """
+        with self.poolLock:
+            myData = self.cache.get(key)
+            if myData is not None:
+                self.cache.move_to_end(key)
+                self.cacheHits += 1
+                return myData
+            self.cacheMisses += 1
+        myData = read()
+        # views of memory maps take no memory, and are already cached by the OS
+        if isinstance(myData, np.memmap) or myData.nbytes > self.cacheSize:
+            return myData
+        myData.setflags(write=False)
+        with self.poolLock:
+            if key not in self.cache:
+                self.cache[key] = myData
+                self.cacheBytes += myData.nbytes
+            while self.cacheBytes > self.cacheSize:
+                self.cacheBytes -= self.cache.popitem(last=False)[1].nbytes
+        return myData
+
+    def GetTimeSelectionKey(self, idt):
+        """ Hashable representation of a selection of time steps (see GetTimeSelection) """
+        steps, order = self.GetTimeSelection(idt)
+        if isinstance(steps, slice):
+            steps = (steps.start, steps.stop, steps.step)
+        elif isinstance(steps, np.ndarray):
+            steps = ("steps", steps.tobytes(), None if order is None else order.tobytes())
+        return steps
+
+    def GetHdf5Dataset(self, absolute_path, hdf5var):
+        """ Return the h5py dataset hdf5var of file absolute_path
+        The file is kept open in a pool of at most maxOpenFiles files,
+        the least recently used file being closed first """
+        with self.poolLock:
+            entry = self.hdf5Pool.get(absolute_path)
+            if entry is None:
+                import h5py
+
+                kwargs = {}
+                if self.chunkCacheSize is not None:
+                    kwargs["rdcc_nbytes"] = self.chunkCacheSize
+                entry = [h5py.File(absolute_path, "r", **kwargs), {}]
+                self.hdf5Pool[absolute_path] = entry
+                while len(self.hdf5Pool) > self.maxOpenFiles:
+                    h5f, datasets = self.hdf5Pool.popitem(last=False)[1]
+                    datasets.clear()
+                    h5f.close()
+            else:
+                self.hdf5Pool.move_to_end(absolute_path)
+            h5f, datasets = entry
+            if hdf5var not in datasets:
+                datasets[hdf5var] = h5f[hdf5var]
+            return datasets[hdf5var]
+
+    def ReadHdf5DatasetChunk(self, absolute_path, hdf5var, firstElement, nchunk, idt=-1, out=None):
+        """ Read block of data in hdf5 format
+        idt!=-1 loads only one time step
+        idt can also be a slice or an increasing array of time steps,
+        read with a single hyperslab or point selection
+        out: if not None, array in which the data are read (with type conversion),
+        for a time step or all time steps """
         lastElement = firstElement + nchunk
 
-        oneDtMem = True if idt != -1 else False
-        h5f = h5py.File(absolute_path, "r")
-        if h5f[hdf5var].ndim == 2:
-            if oneDtMem:
-                myData = h5f[hdf5var][idt, firstElement:lastElement]
+        dset = self.GetHdf5Dataset(absolute_path, hdf5var)
+        if out is not None and not isinstance(idt, (slice, list, np.ndarray)):
+            if dset.ndim == 1:
+                selection = np.s_[firstElement:lastElement]
+            elif idt != -1:
+                selection = np.s_[idt, firstElement:lastElement]
+            else:
+                selection = np.s_[:, firstElement:lastElement]
+            dset.read_direct(out, selection)
+            return out
+        if dset.ndim == 2:
+            if isinstance(idt, (slice, list, np.ndarray)) or idt != -1:
+                myData = dset[idt, firstElement:lastElement]
             else:
-                myData = h5f[hdf5var][:, firstElement:lastElement]
+                myData = dset[:, firstElement:lastElement]
+        else:
+            myData = dset[firstElement:lastElement]
+        return myData
+
+    def GetHdf5TimeRanges(self, dset, idt):
+        """ Convert a time selection (see GetTimeSelection) into a list of
+        (start, count, stride) hyperslabs along the first dimension of dset,
+        merging the evenly spaced steps of an increasing array of steps """
+        if isinstance(idt, slice):
+            return [(idt.start, len(range(idt.start, idt.stop, idt.step)), idt.step)]
+        if isinstance(idt, (list, np.ndarray)):
+            timeRanges = []
+            for step in idt:
+                step = int(step)
+                if timeRanges:
+                    start, count, stride = timeRanges[-1]
+                    if count == 1:
+                        timeRanges[-1] = (start, 2, step - start)
+                        continue
+                    if step == start + count * stride:
+                        timeRanges[-1] = (start, count + 1, stride)
+                        continue
+                timeRanges.append((step, 1, 1))
+            return timeRanges
+        if idt != -1:
+            return [(idt, 1, 1)]
+        return [(0, dset.shape[0], 1)]
+
+    def ReadHdf5DatasetRuns(self, absolute_path, hdf5var, runs, idt=-1):
+        """ Read the cells of the runs [(first, last), ...] in hdf5 format
+        The runs (sorted and disjoint) are read with a single union of hyperslabs
+        idt: as in ReadHdf5DatasetChunk """
+        import h5py
+
+        dset = self.GetHdf5Dataset(absolute_path, hdf5var)
+        ncells = sum(last - first for first, last in runs)
+        fspace = dset.id.get_space()
+        fspace.select_none()
+        if dset.ndim == 2:
+            timeRanges = self.GetHdf5TimeRanges(dset, idt)
+            lastStep = max((start + (count - 1) * stride for start, count, stride in timeRanges), default=-1)
+            if lastStep >= dset.shape[0]:
+                raise IndexError(f"time step {lastStep} is beyond the end of {hdf5var} in {absolute_path}")
+            for start, count, stride in timeRanges:
+                for first, last in runs:
+                    fspace.select_hyperslab((start, first), (count, last - first), stride=(stride, 1), op=h5py.h5s.SELECT_OR)
+            nsteps = sum(count for start, count, stride in timeRanges)
+            oneDtMem = isinstance(idt, (int, np.integer)) and idt != -1
+            shape = (ncells,) if oneDtMem else (nsteps, ncells)
         else:
-            myData = h5f[hdf5var][firstElement:lastElement]
-        h5f.close()
+            for first, last in runs:
+                fspace.select_hyperslab((first,), (last - first,), op=h5py.h5s.SELECT_OR)
+            shape = (ncells,)
+        myData = np.empty(shape, dtype=dset.dtype)
+        if myData.size:
+            dset.id.read(h5py.h5s.create_simple(shape), fspace, myData)
         return myData
 
     def GetDtype(self, data_prec, isInt):
@@ -53,6 +627,22 @@ class seissolxdmf:
             else:
                 return np.dtype("d")
 
+    def GetBinaryMemmap(self, absolute_path, MemDimension, data_prec, isInt):
+        """ Return a read-only memory map of a binary file (posix)
+        viewed as an array of shape (nrows, MemDimension), MemDimension
+        including the zero padding written by SeisSol """
+        with self.poolLock:
+            myMap = self.memmapPool.get(absolute_path)
+            if myMap is None or myMap.shape[1] != MemDimension:
+                data_type = self.GetDtype(data_prec, isInt)
+                nrows = os.path.getsize(absolute_path) // (MemDimension * data_prec)
+                if nrows == 0:
+                    # np.memmap cannot map an empty file
+                    return np.zeros((0, MemDimension), dtype=data_type)
+                myMap = np.memmap(absolute_path, dtype=data_type, mode="r", shape=(nrows, MemDimension))
+                self.memmapPool[absolute_path] = myMap
+            return myMap
+
     def ReadSimpleBinaryFile(self, absolute_path, MemDimension, data_prec, isInt, idt=-1):
         """Read block of data in binary format (posix)
         idt!=-1 loads only one time step
@@ -61,6 +651,10 @@ class seissolxdmf:
         oneDtMem = True if idt != -1 else False
         data_type = self.GetDtype(data_prec, isInt)
 
+        if self.useMemmap:
+            myMap = self.GetBinaryMemmap(absolute_path, MemDimension, data_prec, isInt)
+            return myMap[idt] if oneDtMem else myMap
+
         fid = open(absolute_path, "r")
         if oneDtMem:
             fid.seek(idt * MemDimension * data_prec, os.SEEK_SET)
@@ -72,63 +666,268 @@ class seissolxdmf:
         fid.close()
         return myData
 
-    def ReadSimpleBinaryFileChunk(self, absolute_path, MemDimension, data_prec, isInt, firstElement, nchunk, idt=-1):
+    def ReadSimpleBinaryFileChunk(self, absolute_path, MemDimension, data_prec, isInt, firstElement, nchunk, idt=-1, out=None):
         """Read block of data in binary format (posix)
         same as ReadSimpleBinaryFile: but reads a subset of the second dimension
-        idt!=-1 loads only one time step """
+        idt!=-1 loads only one time step
+        idt can also be a slice or an array of time steps, gathered at once
+        from a memory map of the file
+        out: if not None and of the type of the data, array in which
+        a time step or all time steps are read """
+        if isinstance(idt, (slice, list, np.ndarray)):
+            myMap = self.GetBinaryMemmap(absolute_path, MemDimension, data_prec, isInt)
+            myData = myMap[idt, firstElement : firstElement + nchunk]
+            return myData if self.useMemmap else np.array(myData)
         oneDtMem = True if idt != -1 else False
         data_type = self.GetDtype(data_prec, isInt)
 
-        fid = open(absolute_path, "r")
-        if oneDtMem:
-            assert idt < self.ndt, f"{idt} < {self.ndt}"
-            fid.seek((idt * MemDimension + firstElement) * data_prec, os.SEEK_SET)
-            myData = np.fromfile(fid, dtype=data_type, count=nchunk)
+        if self.useMemmap:
+            myMap = self.GetBinaryMemmap(absolute_path, MemDimension, data_prec, isInt)
+            if oneDtMem:
+                assert idt < self.ndt, f"{idt} < {self.ndt}"
+                return myMap[idt, firstElement : firstElement + nchunk]
+            return myMap[0 : self.ndt, firstElement : firstElement + nchunk]
+
+        shape = (nchunk,) if oneDtMem else (self.ndt, nchunk)
+        if out is not None and out.shape == shape and out.dtype == data_type and out.flags.c_contiguous:
+            myData = out
         else:
-            myData = np.zeros((self.ndt, nchunk))
-            for idt in range(0, self.ndt):
+            myData = np.empty(shape, dtype=data_type)
+        rows = [idt] if oneDtMem else range(0, self.ndt)
+        with open(absolute_path, "rb") as fid:
+            for i, idt in enumerate(rows):
+                assert idt < self.ndt, f"{idt} < {self.ndt}"
                 fid.seek((idt * MemDimension + firstElement) * data_prec, os.SEEK_SET)
-                myData[idt, :] = np.fromfile(fid, dtype=data_type, count=nchunk)
-        fid.close()
+                row = myData if oneDtMem else myData[i]
+                if fid.readinto(row) != row.nbytes:
+                    raise IndexError(f"time step {idt} is beyond the end of {absolute_path}")
         return myData
 
+    def ReadSimpleBinaryFileRuns(self, absolute_path, MemDimension, data_prec, isInt, runs, idt=-1):
+        """ Read the cells of the runs [(first, last), ...] in binary format (posix)
+        from a memory map of the file, so that only the pages spanned by the runs are read
+        idt: as in ReadSimpleBinaryFileChunk """
+        myMap = self.GetBinaryMemmap(absolute_path, MemDimension, data_prec, isInt)
+        if isinstance(idt, (int, np.integer)) and idt != -1:
+            myMap = myMap[idt]
+        elif not isinstance(idt, (slice, list, np.ndarray)):
+            myMap = myMap[0 : self.ndt]
+        else:
+            myMap = myMap[idt]
+        return np.concatenate([myMap[..., first:last] for first, last in runs], axis=-1)
+
+    def ResolveReference(self, element):
+        """ Return the element pointed to by a Reference attribute
+        (or element itself if it is not a reference) """
+        path = element.get("Reference")
+        if not path:
+            return element
+        if path == "XML":
+            path = element.text.strip()
+        # ElementTree does not support absolute paths, make it relative to the root
+        path = path.strip()
+        root = self.tree.getroot()
+        prefix = f"/{root.tag}/"
+        if path.startswith(prefix):
+            path = path[len(prefix) :]
+        ref = root.find(path)
+        if ref is None:
+            raise NameError(f"Reference {path} not found in {self.xdmfFilename}")
+        return ref
+
+    def DescribeDataItem(self, prop):
+        """ Return the index entry (location, precision, dimensions and format) of a DataItem """
+        return {
+            "dataLocation": prop.text.strip(),
+            "precision": int(prop.get("Precision")),
+            "dimensions": [int(val) for val in prop.get("Dimensions").split()],
+            "format": prop.get("Format"),
+            "numberType": prop.get("NumberType"),
+        }
+
+    def IndexGrid(self, grid):
+        """ Add a Uniform Grid element to the index """
+        index = self.index
+        index["ndt"] += 1
+        time = grid.find("Time")
+        if time is not None:
+            index["times"].append(float(time.get("Value")))
+        for attribute in ["Topology", "Geometry"]:
+            if index[attribute] is not None:
+                continue
+            Property = grid.find(attribute)
+            if Property is None:
+                continue
+            Property = self.ResolveReference(Property)
+            prop = Property.find("DataItem")
+            if prop is None:
+                continue
+            entry = self.DescribeDataItem(self.ResolveReference(prop))
+            entry["NumberOfElements"] = int(Property.get("NumberOfElements"))
+            index[attribute] = entry
+        for Property in grid.findall("Attribute"):
+            dataName = Property.get("Name")
+            if dataName in index["attributes"]:
+                continue
+            # time dependent data are selected with a HyperSlab
+            timeDependent = False
+            for prop in Property.iter("DataItem"):
+                prop = self.ResolveReference(prop)
+                timeDependent = timeDependent or prop.get("ItemType") == "HyperSlab"
+                if prop.get("Format") in ["HDF", "Binary"]:
+                    entry = self.DescribeDataItem(prop)
+                    entry["timeDependent"] = timeDependent
+                    index["attributes"][dataName] = entry
+                    break
+
+    def ScanGrid(self, text):
+        """ Add a Uniform Grid to the index from its raw text
+        The grid is only parsed if it defines variables not yet indexed,
+        else only its Time value is read """
+        attributes = self.index["attributes"]
+        names = re.findall(r"""<Attribute\b[^>]*?\bName\s*=\s*["']([^"']*)["']""", text)
+        if any(name not in attributes for name in names):
+            self.IndexGrid(ET.fromstring(text))
+            return
+        self.index["ndt"] += 1
+        time = re.search(r"""<Time\b[^>]*?\bValue\s*=\s*["']([^"']*)["']""", text)
+        if time:
+            self.index["times"].append(float(time.group(1)))
+
+    def ParseXdmf(self, blockSize=2**20):
+        """ Stream-parse the xdmf file into self.index
+        The first Uniform Grid is fully parsed and kept in self.tree, the following
+        ones are only scanned for their Time (see ScanGrid), so that parsing time
+        and memory stay small for long time series.
+        Extra content after </Xdmf> is ignored """
+        endTag = "</Xdmf>"
+        gridEndTag = "</Grid>"
+        gridTag = re.compile(r"<Grid[\s/>]")
+        uniformGrid = re.compile(r"""GridType\s*=\s*["']Uniform["']""")
+        parser = ET.XMLPullParser(events=("start", "end"))
+        self.xdmfTree = None
+        self.index = {"ndt": 0, "times": [], "Topology": None, "Geometry": None, "attributes": {}}
+
+        def feed(text):
+            parser.feed(text)
+            for event, elem in parser.read_events():
+                if event == "start":
+                    if self.xdmfTree is None:
+                        self.xdmfTree = ET.ElementTree(elem)
+                elif elem.tag == "Grid" and elem.get("GridType") == "Uniform":
+                    self.IndexGrid(elem)
+
+        with open(self.xdmfFilename, "r") as fid:
+            text = ""
+            pos = 0
+            endFound = False
+            while not endFound:
+                block = fid.read(blockSize)
+                if not block:
+                    raise ValueError("</Xdmf> not found")
+                text = text[pos:] + block
+                pos = 0
+                end = text.find(endTag)
+                if end != -1:
+                    endFound = True
+                    extra = text[end + len(endTag) :].strip()
+                    text = text[: end + len(endTag)]
+                while True:
+                    match = gridTag.search(text, pos)
+                    if match is None:
+                        # keep the end of the text, in case a Grid tag spans two blocks
+                        safe = len(text) if endFound else max(pos, len(text) - len("<Grid "))
+                        feed(text[pos:safe])
+                        pos = safe
+                        break
+                    start = match.start()
+                    tagEnd = text.find(">", start)
+                    if tagEnd == -1:
+                        feed(text[pos:start])
+                        pos = start
+                        break
+                    tagEnd += 1
+                    if self.index["ndt"] == 0 or not uniformGrid.search(text, start, tagEnd) or text[tagEnd - 2] == "/":
+                        # first Uniform Grid or enclosing Grid, let the parser handle it
+                        feed(text[pos:tagEnd])
+                        pos = tagEnd
+                        continue
+                    gridEnd = text.find(gridEndTag, tagEnd)
+                    if gridEnd == -1:
+                        feed(text[pos:start])
+                        pos = start
+                        break
+                    gridEnd += len(gridEndTag)
+                    feed(text[pos:start])
+                    self.ScanGrid(text[start:gridEnd])
+                    pos = gridEnd
+            # Remove potential extra content at the end of the file
+            while not extra:
+                block = fid.read(blockSize)
+                if not block:
+                    break
+                extra = block.strip()
+        parser.close()
+        if extra:
+            print(f'Warning: extra content at the end of {self.xdmfFilename} detected')
+
+    def GetMetadataCacheKey(self):
+        """ Identify the xdmf file state (path, size and modification time),
+        the key changes e.g. when SeisSol appends new time steps """
+        stat = os.stat(self.xdmfFilename)
+        return {"xdmfFilename": os.path.abspath(self.xdmfFilename), "size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+    def LoadMetadataCache(self):
+        """ Load self.index from the sidecar file, if it is valid for the current xdmf file
+        returns True on success """
+        try:
+            with open(self.metadataCacheFilename, "r") as fid:
+                cache = json.load(fid)
+        except (OSError, ValueError):
+            return False
+        if cache.get("version") != self.metadataCacheVersion or cache.get("key") != self.GetMetadataCacheKey():
+            return False
+        self.index = cache["index"]
+        return True
+
+    def WriteMetadataCache(self):
+        """ Write self.index to the sidecar file """
+        cache = {"version": self.metadataCacheVersion, "key": self.GetMetadataCacheKey(), "index": self.index}
+        tmpFilename = f"{self.metadataCacheFilename}.{os.getpid()}.tmp"
+        try:
+            with open(tmpFilename, "w") as fid:
+                json.dump(cache, fid)
+            # atomic, in case several jobs write the cache concurrently
+            os.replace(tmpFilename, self.metadataCacheFilename)
+        except OSError as e:
+            if os.path.exists(tmpFilename):
+                os.remove(tmpFilename)
+            print(f"Warning: could not write metadata cache {self.metadataCacheFilename}: {e}")
+
+    def GetMeshIndexEntry(self, attribute):
+        """ Return the index entry of either Topology or Geometry """
+        entry = self.index[attribute]
+        if entry is None:
+            raise NameError(f"{attribute} not found in {self.xdmfFilename}")
+        return entry
+
     def GetDataLocationPrecisionNElementsMemDimension(self, attribute):
         """ Common function called by ReadTopologyOrGeometry """
-        root = self.tree.getroot()
-        for Property in root.findall(".//%s" % (attribute)):
-            nElements = int(Property.get("NumberOfElements"))
-            break
-        for Property in root.findall(".//%s/DataItem" % (attribute)):
-            dataLocation = Property.text
-            data_prec = int(Property.get("Precision"))
-            MemDimension = [int(val) for val in Property.get("Dimensions").split()]
-            break
-        return [dataLocation, data_prec, nElements, MemDimension]
+        entry = self.GetMeshIndexEntry(attribute)
+        return [entry["dataLocation"], entry["precision"], entry["NumberOfElements"], list(entry["dimensions"])]
 
     def GetDataLocationPrecisionMemDimension(self, dataName):
-        """ Common function called by ReadData """
-
-        def get(prop):
-            dataLocation = prop.text
-            data_prec = int(prop.get("Precision"))
-            dims = prop.get("Dimensions").split()
-            if len(dims) == 1:
-                MemDimension = int(prop.get("Dimensions").split()[0])
-            else:
-                MemDimension = int(prop.get("Dimensions").split()[1])
-            return [dataLocation, data_prec, MemDimension]
-
-        root = self.tree.getroot()
-        for Property in root.findall(".//Attribute"):
-            if Property.get("Name") == dataName:
-                for prop in Property.findall(".//DataItem"):
-                    if prop.get("Format") in ["HDF", "Binary"]:
-                        return get(prop)
-                    path = prop.get("Reference")
-                    if path is not None:
-                        ref = tree.xpath(path)[0]
-                        return get(ref)
-        raise NameError(f"{dataName} not found in dataset, available variables are {self.ReadAvailableDataFields()}")
+        """ Common function called by ReadData
+        (for a derived field, returns the values of its first component) """
+        derivedField = self.GetDerivedField(dataName)
+        if derivedField:
+            dataName = derivedField[0][0]
+        entry = self.index["attributes"].get(dataName)
+        if entry is None:
+            raise NameError(f"{dataName} not found in dataset, available variables are {self.ReadAvailableDataFields()}")
+        dims = entry["dimensions"]
+        MemDimension = dims[0] if len(dims) == 1 else dims[1]
+        return [entry["dataLocation"], entry["precision"], MemDimension]
 
     def ReadTopologyOrGeometry(self, attribute):
         """ Common function to read either connect or geometry """
@@ -156,13 +955,143 @@ class seissolxdmf:
         """ Read the connectivity matrice defining the cells """
         return self.ReadTopologyOrGeometry("Geometry")
 
+    def ReadCellCentroids(self, nchunk=2**20):
+        """ Compute the centroids of the cells (average of all their nodes),
+        by chunks of nchunk cells """
+        xyz = self.ReadGeometry()
+        connect = self.ReadConnect()
+        centroids = np.empty((connect.shape[0], xyz.shape[1]))
+        for first in range(0, connect.shape[0], nchunk):
+            centroids[first : first + nchunk] = xyz[connect[first : first + nchunk]].mean(axis=1)
+        return centroids
+
+    def GetMeshCacheKey(self):
+        """ Identify the mesh files state (path, size and modification time) """
+        key = {"nElements": self.nElements}
+        for attribute in ["Topology", "Geometry"]:
+            filename = self.GetMeshIndexEntry(attribute)["dataLocation"].split(":")[0]
+            filename = os.path.abspath(os.path.join(os.path.dirname(self.xdmfFilename), filename))
+            stat = os.stat(filename)
+            key[attribute] = [filename, stat.st_size, stat.st_mtime_ns]
+        return key
+
+    def GetSpatialIndex(self, cacheFilename=None, pointsPerBin=8):
+        """ Return a SpatialIndex over the cell centroids, allowing box, sphere
+        and nearest cell queries without scanning all cells
+        cacheFilename: if given, npz file from which the index is loaded
+        (if built from the same mesh files) or to which it is written """
+        key = self.GetMeshCacheKey() if cacheFilename else None
+        if cacheFilename:
+            index = SpatialIndex.Load(cacheFilename, key)
+            if index is not None:
+                return index
+        index = SpatialIndex(self.ReadCellCentroids(), pointsPerBin)
+        if cacheFilename:
+            try:
+                index.Save(cacheFilename, key)
+            except OSError as e:
+                print(f"Warning: could not write spatial index {cacheFilename}: {e}")
+        return index
+
+    def LocateStations(self, points, spatialIndex=None, candidates=8):
+        """ Find the cells containing points (array of shape (npoints, 3))
+        among the candidates cells of closest centroids (see GetSpatialIndex),
+        more candidates being tested for the points not found
+        For triangles, the points are projected on the plane of the cells.
+        Points outside the mesh are mapped to the closest point of the best candidate cell.
+        returns [cellIds, barycentric]: the cell containing each point, and the
+        barycentric coordinates of the point in the cell, of shape (npoints, nodesPerElement) """
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        if spatialIndex is None:
+            spatialIndex = self.GetSpatialIndex()
+        xyz = self.ReadGeometry()
+        connect = self.ReadConnect()
+        cellIds = np.empty(len(points), dtype=np.int64)
+        barycentric = np.empty((len(points), connect.shape[1]))
+        # points not inside any candidate (e.g. in elongated cells) are retried with more candidates
+        todo = np.arange(len(points))
+        k = candidates
+        while True:
+            k = min(k, self.nElements)
+            candidateIds = spatialIndex.QueryNearest(points[todo], k).reshape(len(todo), k)
+            vertices = xyz[connect[candidateIds]]
+            edges = np.swapaxes(vertices[:, :, 1:] - vertices[:, :, :1], -1, -2)
+            # least squares for triangles, i.e. projected on their plane
+            coords = np.einsum("pkij,pkj->pki", np.linalg.pinv(edges), points[todo, None, :] - vertices[:, :, 0])
+            candidateBarycentric = np.concatenate((1.0 - coords.sum(axis=-1, keepdims=True), coords), axis=-1)
+            best = np.argmax(candidateBarycentric.min(axis=-1), axis=1)
+            cellIds[todo] = candidateIds[np.arange(len(todo)), best]
+            barycentric[todo] = candidateBarycentric[np.arange(len(todo)), best]
+            outside = barycentric[todo].min(axis=-1) < -1e-6
+            if not outside.any() or k == self.nElements or k >= 64 * candidates:
+                break
+            todo = todo[outside]
+            k *= 4
+        outside = barycentric.min(axis=-1) < -1e-6
+        if outside.any():
+            print(f"Warning: {np.count_nonzero(outside)} points are not inside any cell, using the closest cell")
+        barycentric = np.maximum(barycentric, 0.0)
+        barycentric /= barycentric.sum(axis=-1, keepdims=True)
+        return [cellIds, barycentric]
+
+    def GetStationInterpolator(self, points, interpolation="barycentric", spatialIndex=None, candidates=8):
+        """ Return a StationInterpolator evaluating cell data at points (see LocateStations)
+        interpolation:
+        - cell: value of the cell containing the point
+        - barycentric: the cell values are averaged at the nodes of the cell containing the point
+        (over the cells sharing each node), and interpolated linearly at the point """
+        if interpolation not in ["cell", "barycentric"]:
+            raise ValueError(f"unknown interpolation {interpolation}, should be cell or barycentric")
+        cellIds, barycentric = self.LocateStations(points, spatialIndex, candidates)
+        nstations = len(cellIds)
+        if interpolation == "cell":
+            cells, columns = np.unique(cellIds, return_inverse=True)
+            return StationInterpolator(cells, np.arange(nstations), columns.reshape(-1), np.ones(nstations), nstations)
+        connect = self.ReadConnect()
+        npe = connect.shape[1]
+        stationNodes = connect[cellIds].reshape(-1)
+        nodes = np.unique(stationNodes)
+        cells = np.nonzero(np.isin(connect, nodes).any(axis=1))[0]
+        # (node, column) pairs of the cells sharing the nodes of the stations, sorted by node
+        pairNodes = connect[cells].reshape(-1)
+        pairColumns = np.repeat(np.arange(len(cells)), npe)
+        order = np.argsort(pairNodes, kind="stable")
+        pairNodes, pairColumns = pairNodes[order], pairColumns[order]
+        starts = np.searchsorted(pairNodes, stationNodes, side="left")
+        ends = np.searchsorted(pairNodes, stationNodes, side="right")
+        lengths = ends - starts
+        rows = np.repeat(np.repeat(np.arange(nstations), npe), lengths)
+        weights = np.repeat(barycentric.reshape(-1) / lengths, lengths)
+        columns = pairColumns[concatenate_ranges(starts, ends)]
+        return StationInterpolator(cells, rows, columns, weights, nstations)
+
+    def ReadStationData(self, dataName, interpolator, idt=-1, blockMemory=2**26):
+        """ Evaluate the data array named 'dataName' at the stations of interpolator
+        (see GetStationInterpolator), only reading the cells required (see ReadDataCells)
+        The time steps are read by blocks of about blockMemory bytes.
+        idt: time steps (see ReadData)
+        returns an array of shape (nstations) (one time step) or (nstations, nsteps) """
+        if isinstance(idt, (int, np.integer)) and idt != -1:
+            return interpolator.Apply(self.ReadDataCells(dataName, interpolator.cells, idt))
+        steps = np.arange(self.ndt)
+        if not (isinstance(idt, (int, np.integer)) and idt == -1):
+            steps = steps[idt] if isinstance(idt, slice) else np.array(idt, dtype=np.int64).reshape(-1)
+            steps[steps < 0] += self.ndt
+        nblock = max(1, blockMemory // (8 * max(1, len(interpolator.cells))))
+        myData = np.empty((interpolator.nstations, len(steps)))
+        for first in range(0, len(steps), nblock):
+            block = steps[first : first + nblock]
+            stride = block[1] - block[0] if len(block) > 1 else 1
+            if stride > 0 and np.all(np.diff(block) == stride):
+                # evenly spaced steps (e.g. all steps) are read as a slice
+                block = slice(int(block[0]), int(block[-1]) + 1, int(stride))
+            nsteps = min(nblock, len(steps) - first)
+            myData[:, first : first + nsteps] = interpolator.Apply(self.ReadDataCells(dataName, interpolator.cells, block)).T
+        return myData
+
     def ReadNdt(self):
         """ read number of time steps in the file """
-        root = self.tree.getroot()
-        ndt = 0
-        for Property in root.findall(".//Grid"):
-            if Property.get("GridType") == "Uniform":
-                ndt = ndt + 1
+        ndt = self.index["ndt"]
         if ndt == 0:
             raise NameError("ndt=0,( no GridType=Uniform found in xdmf)")
         else:
@@ -170,62 +1099,53 @@ class seissolxdmf:
 
     def ReadTimes(self):
         """returns the list of output times written in the file"""
-        root = self.tree.getroot()
-        outputTimes = []
-        for Property in root.findall("Domain/Grid/Grid/Time"):
-            outputTimes.append(float(Property.get("Value")))
-        return outputTimes
+        return list(self.index["times"])
 
     def ReadAttributeValue(self, attribute, list_possible_location):
         root = self.tree.getroot()
         for location in list_possible_location:
             for Property in root.findall(location):
-                path = Property.get("Reference")
-                if not path:
-                    return Property.get(attribute)
-                else:
-                    ref = tree.xpath(path)[0]
-                    return ref.get(attribute)
+                return self.ResolveReference(Property).get(attribute)
         raise NameError(f"{attribute} not found in {list_possible_location}")
 
     def ReadNElements(self):
         """ read number of cell elements of the mesh """
-        list_possible_location = ["Domain/Grid/Grid/Topology", "Domain/Grid/Topology"]
-        value  = self.ReadAttributeValue("NumberOfElements", list_possible_location)
-        return int(value)
+        return self.GetMeshIndexEntry("Topology")["NumberOfElements"]
 
     def ReadNNodes(self):
         """ read number of vertex of the mesh """
-        list_possible_location = ["Domain/Grid/Grid/Geometry", "Domain/Grid/Geometry"]
-        value  = self.ReadAttributeValue("NumberOfElements", list_possible_location)
-        return int(value)
+        return self.GetMeshIndexEntry("Geometry")["NumberOfElements"]
 
     def ReadNodesPerElement(self):
         """ read number of nodes per elements of the mesh """
-        list_possible_location = ["Domain/Grid/Grid/Topology/DataItem", "Domain/Grid/Topology/DataItem"]
-        value  = self.ReadAttributeValue("Dimensions", list_possible_location)
-        return int(value.split()[1])
+        return self.GetMeshIndexEntry("Topology")["dimensions"][1]
 
     def ReadAvailableDataFields(self):
         """ read all available data fields, e.g. SRs or P_n """
-        root = self.tree.getroot()
-        availableDataFields = set()
-        for Property in root.findall(".//Attribute"):
-            availableDataFields.add(Property.get("Name"))
-        return availableDataFields
+        return set(self.index["attributes"])
+
+    def GetDerivedField(self, dataName):
+        """ Return [components, function] if dataName is a derived field
+        (see register_derived_field) not stored but computable from the stored data fields,
+        else None """
+        attributes = self.index["attributes"]
+        if dataName in attributes:
+            return None
+        for components, function in derived_fields.get(dataName, []):
+            if all(component in attributes for component in components):
+                return [components, function]
+        return None
+
+    def ReadAvailableDerivedFields(self):
+        """ read all derived fields computable from the available data fields, e.g. SR """
+        return set(name for name in derived_fields if self.GetDerivedField(name))
 
     def ReadTimeStep(self):
         """ reading the time step (dt) in the xdmf file """
-        root = self.tree.getroot()
-        i = 0
-        for Property in root.findall("Domain/Grid/Grid/Time"):
-            if i == 0:
-                dt = float(Property.get("Value"))
-                i = 1
-            else:
-                dt = float(Property.get("Value")) - dt
-                return dt
-        raise NameError("time step could not be determined")
+        times = self.index["times"]
+        if len(times) < 2:
+            raise NameError("time step could not be determined")
+        return times[1] - times[0]
 
     def Read1dData(self, dataName, nElements, isInt=False):
         """ Read 1 dimension array (used by ReadPartition) """
@@ -250,31 +1170,350 @@ class seissolxdmf:
         partition = self.Read1dData("partition", self.nElements, isInt=True)
         return partition
 
-    def ReadData(self, dataName, idt=-1):
+    def GetTimeSelection(self, idt):
+        """ Normalize a selection of time steps
+        idt: a time step, -1 (all time steps), a slice or a list/array of time steps
+        returns [steps, order]: steps is either an int, a slice with positive step,
+        or an increasing array of time steps, and order (or None) reorders the rows
+        read with steps into the requested order """
+        if isinstance(idt, (int, np.integer)):
+            return [int(idt), None]
+        if isinstance(idt, slice):
+            start, stop, step = idt.indices(self.ndt)
+            if step > 0 and start < stop:
+                return [slice(start, stop, step), None]
+            idt = range(start, stop, step)
+        steps = np.array(idt, dtype=np.int64).reshape(-1)
+        steps[steps < 0] += self.ndt
+        if steps.size and (steps.min() < 0 or steps.max() >= self.ndt):
+            raise IndexError(f"time steps {idt} out of range for ndt={self.ndt}")
+        if np.all(np.diff(steps) > 0):
+            return [steps, None]
+        steps, order = np.unique(steps, return_inverse=True)
+        return [steps, order]
+
+    def CastOrFill(self, myData, dtype=None, out=None):
+        """ Return myData converted to dtype (if not None),
+        or copied into the array out (if not None and not already myData) """
+        if out is not None:
+            if out.shape != myData.shape:
+                raise ValueError(f"out has shape {out.shape}, expected {myData.shape}")
+            if out is not myData:
+                np.copyto(out, myData, casting="unsafe")
+            return out
+        if dtype is not None and myData.dtype != dtype:
+            return myData.astype(dtype)
+        return myData
+
+    def ReadData(self, dataName, idt=-1, dtype=None, out=None):
         """ Load a data array named 'dataName' (e.g. SRs)
         if idt!=-1, only the time step idt is loaded
-        else all time steps are loaded   """
+        else all time steps are loaded
+        idt can also be a slice or a list of time steps,
+        then an array of shape (len(steps), nElements) is returned
+        dataName can also be a derived field (e.g. SR, see register_derived_field)
+        dtype, out: see ReadDataChunk """
 
-        return self.ReadDataChunk(dataName, firstElement=0, nchunk=self.nElements, idt=idt)
+        return self.ReadDataChunk(dataName, firstElement=0, nchunk=self.nElements, idt=idt, dtype=dtype, out=out)
 
-    def ReadDataChunk(self, dataName, firstElement, nchunk, idt=-1):
+    def ReadDerivedData(self, dataName, read, ncells, idt=-1, blockMemory=2**26, out=None):
+        """ Compute the derived field dataName from its components read with read(component, steps)
+        Several time steps are computed by blocks of about blockMemory bytes,
+        to bound the size of the intermediate arrays
+        out: if not None, array in which the blocks are assembled """
+        components, function = self.GetDerivedField(dataName)
+        steps, order = self.GetTimeSelection(idt)
+        if isinstance(steps, int):
+            if steps != -1:
+                return self.CastOrFill(function(*[read(component, steps) for component in components]), out=out)
+            steps = np.arange(self.ndt)
+        elif isinstance(steps, slice):
+            steps = np.arange(steps.start, steps.stop, steps.step)
+        nblock = max(1, blockMemory // (8 * max(1, ncells)))
+        myData = out if order is None and out is not None and out.shape == (len(steps), ncells) else None
+        for first in range(0, len(steps), nblock):
+            block = steps[first : first + nblock]
+            result = function(*[read(component, block) for component in components])
+            if myData is None:
+                myData = np.empty((len(steps), ncells), dtype=result.dtype)
+            myData[first : first + len(block)] = result
+        if myData is None:
+            myData = np.empty((0, ncells))
+        if order is not None:
+            myData = myData[order]
+        return self.CastOrFill(myData, out=out)
+
+    def ReadDataChunk(self, dataName, firstElement, nchunk, idt=-1, useCache=True, dtype=None, out=None):
         """ Load a chunk of a data array named 'dataName' (e.g. SRs)
         That is instead of loading 0:nElements, load firstElement:firstElement+nchunk
-        This function is used for generating in parallel Ground motion estimate maps
+        This function is used for generating in parallel Ground motion estimate maps (see MapDataChunks)
         if idt!=-1, only the time step idt is loaded
-        else all time steps are loaded   """
+        else all time steps are loaded
+        idt can also be a slice or a list of time steps (see GetTimeSelection),
+        read in a single call
+        dataName can also be a derived field (e.g. SR, see register_derived_field)
+        useCache: if cacheSize > 0, look for the data in the cache first
+        The data are returned with the type they are stored with, unless dtype is given.
+        out: if not None, array (of the shape of the data read) filled in place and returned,
+        read directly into when possible, to avoid allocating an array at each call """
+        if useCache and self.cacheSize > 0:
+            key = ("chunk", dataName, self.GetTimeSelectionKey(idt), firstElement, nchunk)
+            myData = self.GetCachedData(key, lambda: self.ReadDataChunk(dataName, firstElement, nchunk, idt, useCache=False))
+            return self.CastOrFill(myData, dtype, out)
+        if self.GetDerivedField(dataName):
+            read = lambda component, steps: self.ReadDataChunk(component, firstElement, nchunk, steps)
+            return self.CastOrFill(self.ReadDerivedData(dataName, read, nchunk, idt, out=out), dtype, out)
         path = os.path.join(os.path.dirname(self.xdmfFilename), "")
         dataLocation, data_prec, MemDimension = self.GetDataLocationPrecisionMemDimension(dataName)
         splitArgs = dataLocation.split(":")
         isHdf5 = True if len(splitArgs) == 2 else False
-        oneDtMem = True if idt != -1 else False
+        idt, order = self.GetTimeSelection(idt)
+        outRead = out if order is None else None
         if isHdf5:
             filename, hdf5var = splitArgs
-            myData = self.ReadHdf5DatasetChunk(path + filename, hdf5var, firstElement, nchunk, idt)
+            myData = self.ReadHdf5DatasetChunk(path + filename, hdf5var, firstElement, nchunk, idt, out=outRead)
         else:
-            myData = self.ReadSimpleBinaryFileChunk(path + dataLocation, MemDimension, data_prec, isInt=False, firstElement=firstElement, nchunk=nchunk, idt=idt)
+            myData = self.ReadSimpleBinaryFileChunk(path + dataLocation, MemDimension, data_prec, isInt=False, firstElement=firstElement, nchunk=nchunk, idt=idt, out=outRead)
+        if order is not None and myData.ndim == 2:
+            myData = myData[order]
+        return self.CastOrFill(myData, dtype, out)
+
+    def GetCellRuns(self, cellIds, maxGap=16, maxRuns=256):
+        """ Group increasing cell ids into runs [(first, last), ...] of contiguous cells
+        runs separated by less than maxGap cells are merged, reading a few
+        unneeded cells being cheaper than an additional selection.
+        If there are more than maxRuns runs, the runs separated by the
+        smallest gaps are merged until there are at most maxRuns runs """
+        gaps = np.diff(cellIds) - 1
+        breaks = np.nonzero(gaps >= maxGap)[0]
+        if maxRuns > 0 and breaks.size >= maxRuns:
+            # only keep the maxRuns - 1 largest gaps
+            largest = np.argsort(gaps[breaks], kind="stable")[breaks.size - maxRuns + 1 :]
+            breaks = np.sort(breaks[largest])
+        firsts = cellIds[np.concatenate(([0], breaks + 1))]
+        lasts = cellIds[np.concatenate((breaks, [len(cellIds) - 1]))] + 1
+        return list(zip(firsts.tolist(), lasts.tolist()))
+
+    def ReadDataCells(self, dataName, cellIds, idt=-1, denseFraction=0.5, maxGap=16, maxRuns=256, useCache=True, dtype=None, out=None):
+        """ Load the cells cellIds (list or array of ids, or boolean mask)
+        of a data array named 'dataName' (e.g. SRs)
+        Only the runs of contiguous cells spanned by cellIds are read (see GetCellRuns).
+        If the cells make up more than denseFraction of the range they span,
+        the whole range is read instead.
+        idt, useCache, dtype, out: as in ReadDataChunk
+        returns an array of shape (len(cellIds)) or (nsteps, len(cellIds)) """
+        cellIds = np.asarray(cellIds)
+        if cellIds.dtype == bool:
+            cellIds = np.nonzero(cellIds)[0]
+        cellIds = cellIds.astype(np.int64).reshape(-1)
+        if useCache and self.cacheSize > 0:
+            key = ("cells", dataName, self.GetTimeSelectionKey(idt), cellIds.tobytes())
+            myData = self.GetCachedData(key, lambda: self.ReadDataCells(dataName, cellIds, idt, denseFraction, maxGap, maxRuns, useCache=False))
+            return self.CastOrFill(myData, dtype, out)
+        if self.GetDerivedField(dataName):
+            read = lambda component, steps: self.ReadDataCells(component, cellIds, steps, denseFraction, maxGap, maxRuns)
+            return self.CastOrFill(self.ReadDerivedData(dataName, read, cellIds.size, idt, out=out), dtype, out)
+        ids, order = cellIds, None
+        if not np.all(np.diff(ids) > 0):
+            ids, order = np.unique(cellIds, return_inverse=True)
+        if ids.size == 0:
+            return self.ReadDataChunk(dataName, 0, 0, idt, dtype=dtype, out=out)
+        first, last = int(ids[0]), int(ids[-1]) + 1
+        if order is None and ids.size == last - first:
+            # contiguous cells
+            return self.ReadDataChunk(dataName, first, last - first, idt, dtype=dtype, out=out)
+        runs = self.GetCellRuns(ids, maxGap, maxRuns)
+        if len(runs) == 1 or ids.size >= denseFraction * (last - first):
+            myData = self.ReadDataChunk(dataName, first, last - first, idt)
+            ids = ids - first
+        else:
+            path = os.path.join(os.path.dirname(self.xdmfFilename), "")
+            dataLocation, data_prec, MemDimension = self.GetDataLocationPrecisionMemDimension(dataName)
+            splitArgs = dataLocation.split(":")
+            isHdf5 = True if len(splitArgs) == 2 else False
+            steps, stepOrder = self.GetTimeSelection(idt)
+            if isHdf5:
+                filename, hdf5var = splitArgs
+                myData = self.ReadHdf5DatasetRuns(path + filename, hdf5var, runs, steps)
+            else:
+                myData = self.ReadSimpleBinaryFileRuns(path + dataLocation, MemDimension, data_prec, False, runs, steps)
+            if stepOrder is not None and myData.ndim == 2:
+                myData = myData[stepOrder]
+            # position of each id in the concatenated runs
+            firsts = np.array([run[0] for run in runs])
+            offsets = np.cumsum([0] + [run[1] - run[0] for run in runs[:-1]])
+            iRun = np.searchsorted(firsts, ids, side="right") - 1
+            ids = offsets[iRun] + ids - firsts[iRun]
+        if order is not None:
+            ids = ids[order]
+        if ids.size == myData.shape[-1] and np.all(np.diff(ids) == 1):
+            # all cells read are selected
+            return self.CastOrFill(myData, dtype, out)
+        return self.CastOrFill(myData[..., ids], dtype, out)
+
+    def IterTimeSteps(self, dataName, steps=None, cells=None, prefetch=2, fillValue=None, dtype=None):
+        """ Iterate over the time steps of a data array named 'dataName' (e.g. SRs)
+        yielding (idt, data), data being of shape (nElements) (or (len(cells)))
+        The next prefetch time steps are read by a background thread into a ring
+        of buffers, while the current one is processed. The buffers are reused:
+        data is only valid until the next iteration (copy it to keep it).
+        steps: time steps to read (slice or list, all time steps by default)
+        cells: cell ids to read (see ReadDataCells), all cells by default
+        fillValue: if not None, time steps that cannot be read (e.g. beyond
+        the end of the file of an interrupted simulation) are filled with
+        fillValue instead of raising an error
+        dtype: type of the data yielded, the type of the stored data by default """
+        import queue
+
+        if steps is None:
+            steps = range(self.ndt)
+        elif isinstance(steps, slice):
+            steps = range(*steps.indices(self.ndt))
+        steps = [int(idt) for idt in steps]
+        if cells is None:
+            nchunk = self.nElements
+        else:
+            cells = np.asarray(cells)
+            nchunk = np.count_nonzero(cells) if cells.dtype == bool else cells.size
+
+        def read(idt, out=None):
+            try:
+                if cells is None:
+                    myData = self.ReadData(dataName, idt, dtype=dtype, out=out)
+                else:
+                    myData = self.ReadDataCells(dataName, cells, idt, dtype=dtype, out=out)
+                if myData.shape == (nchunk,):
+                    return myData
+            except IndexError:
+                pass
+            if fillValue is None:
+                raise IndexError(f"time step {idt} of {dataName} could not be read")
+            print(f"time step {idt} of {dataName} is corrupted, replacing with {fillValue}")
+            if out is None:
+                return np.full(nchunk, fillValue, dtype=dtype)
+            out[:] = fillValue
+            return out
+
+        if prefetch < 1:
+            for idt in steps:
+                yield idt, read(idt)
+            return
+
+        buffers = [None] * (prefetch + 2)
+        filled = queue.Queue(maxsize=prefetch)
+        stop = threading.Event()
+        done = object()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    filled.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def worker():
+            try:
+                # with a ring of prefetch + 2 buffers, the buffer filled is neither
+                # in the queue nor the one being processed by the consumer
+                # each buffer is allocated by its first read, and then read into
+                for i, idt in enumerate(steps):
+                    k = i % len(buffers)
+                    myData = read(idt, buffers[k])
+                    if buffers[k] is None:
+                        buffers[k] = np.array(myData)
+                    if not put((idt, buffers[k])):
+                        return
+                put(done)
+            except BaseException as e:
+                put(e)
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = filled.get()
+                if item is done:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            thread.join()
+
+    def RunChunkKernel(self, dataNames, kernel, firstElement, nchunk, idt=-1):
+        """ Apply kernel to the chunk firstElement:firstElement+nchunk of the data arrays dataNames """
+        return kernel(*[self.ReadDataChunk(dataName, firstElement, nchunk, idt) for dataName in dataNames])
+
+    def MapDataChunks(self, dataName, kernel, idt=-1, nchunk=None, nProcesses=None):
+        """ Apply kernel to chunks of cells of the data array(s) 'dataName' in parallel
+        and assemble the per-cell results (e.g. to generate ground motion estimate maps)
+        dataName: a data array name (e.g. SRs) or a list of names (e.g. ['v1', 'v2', 'v3'])
+        kernel: function called with the chunk of each array (as read by ReadDataChunk),
+        returning an array whose first dimension is the number of cells of the chunk.
+        With nProcesses > 1, kernel must be picklable (e.g. a module-level function).
+        idt: time steps read (see ReadDataChunk), all by default
+        nchunk: number of cells per chunk (by default 4 chunks per process)
+        nProcesses: number of worker processes (by default the number of cores),
+        each worker reopening its own files
+        returns an array of shape (nElements, ...) """
+        import multiprocessing
+        import pickle
+
+        dataNames = [dataName] if isinstance(dataName, str) else list(dataName)
+        if nProcesses is None:
+            nProcesses = os.cpu_count() or 1
+        if nchunk is None:
+            nchunk = -(-self.nElements // (4 * nProcesses))
+        nchunk = max(1, nchunk)
+        chunks = [(first, min(nchunk, self.nElements - first)) for first in range(0, self.nElements, nchunk)]
+
+        if nProcesses == 1:
+            results = ((first, self.RunChunkKernel(dataNames, kernel, first, n, idt)) for first, n in chunks)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(nProcesses, initializer=_init_chunk_worker, initargs=(pickle.dumps(self), dataNames, kernel, idt))
+            results = pool.imap_unordered(_run_chunk_worker, chunks)
+        try:
+            myData = None
+            for first, result in results:
+                result = np.asarray(result)
+                if myData is None:
+                    myData = np.empty((self.nElements,) + result.shape[1:], dtype=result.dtype)
+                myData[first : first + result.shape[0]] = result
+        finally:
+            if pool is not None:
+                pool.terminate()
         return myData
 
+    def ReduceData(self, dataName, reduction, steps=None, threshold=None, nProcesses=1, chunkMemory=2**28, prefetch=2):
+        """ Reduce a data array named 'dataName' (e.g. SRs) over time,
+        without loading all time steps in memory (see TemporalReduction for the reductions)
+        e.g. peak slip rate: ReduceData('SR', 'max'), rupture time: ReduceData('SR', 'first_crossing', threshold=0.001)
+        steps: time steps reduced (slice or list, all time steps by default)
+        nProcesses: if 1, the time steps are streamed one after the other (see IterTimeSteps),
+        else chunks of cells are reduced in parallel (see MapDataChunks),
+        each chunk of all steps taking at most about chunkMemory bytes
+        returns an array of shape (nElements) """
+        if steps is None:
+            steps = range(self.ndt)
+        elif isinstance(steps, slice):
+            steps = range(*steps.indices(self.ndt))
+        steps = [int(idt) for idt in steps]
+        times = self.ReadTimes()
+        myReduction = TemporalReduction(reduction, steps, [times[idt] for idt in steps], threshold)
+        if nProcesses == 1:
+            for idt, myData in self.IterTimeSteps(dataName, steps, prefetch=prefetch):
+                myReduction.Update(myData)
+            return myReduction.Result()
+        if nProcesses is None:
+            nProcesses = os.cpu_count() or 1
+        nchunk = -(-self.nElements // (4 * nProcesses))
+        nchunk = max(1, min(nchunk, chunkMemory // (8 * max(1, len(steps)))))
+        return self.MapDataChunks(dataName, myReduction, idt=steps, nchunk=nchunk, nProcesses=nProcesses)
+
     def LoadData(self, dataName, nElements, idt=0, oneDtMem=False, firstElement=-1):
         """ Do the same as ReadDataChunk. here for backward compatibility """
         dataLocation, data_prec, MemDimension = self.GetDataLocationPrecisionMemDimension(dataName)
@@ -2,8 +2,6 @@
 import argparse
 import os
 import os.path
-from warnings import warn
-
 import numpy as np
 import seissolxdmf
 
@@ -38,7 +36,10 @@ parser.add_argument(
     "--variables",
     nargs="+",
     metavar="variables",
-    help="Names of variables to extract (e.g. SRs or all)",
+    help=(
+        "Names of variables to extract (e.g. SRs or all). Derived fields (e.g. SR,"
+        " v_norm) are computed on the fly from the variables available"
+    ),
     default=["all"],
 )
 parser.add_argument(
@@ -59,7 +60,81 @@ parser.add_argument(
     "--compression",
     type=int,
     default=4,
-    help="compression level (for hdf5 format only)",
+    help="compression level (for hdf5 format and gzip codec only)",
+)
+parser.add_argument(
+    "--codec",
+    type=str,
+    default="gzip",
+    help=(
+        "compression codec (for hdf5 format only): gzip, lzf (fast), none, the name"
+        " of a filter of hdf5plugin if installed (e.g. zstd, lz4, blosc) or the id"
+        " of a hdf5 filter available"
+    ),
+)
+parser.add_argument(
+    "--threads",
+    type=int,
+    help=(
+        "number of threads compressing the data with gzip (for hdf5 format only,"
+        " default: number of cores)"
+    ),
+)
+parser.add_argument(
+    "--reduce",
+    choices=["max", "min", "absmax", "mean", "argmax", "argmin"],
+    help=(
+        "reduce the variables over the selected time steps in a single streaming"
+        " pass (e.g. peak slip rate maps), argmax and argmin giving the time of the"
+        " extremum. _{reduce} is appended to the prefix"
+    ),
+)
+parser.add_argument(
+    "--window",
+    type=int,
+    help=(
+        "with --reduce, write one time step per window of N selected time steps"
+        " (default: a single time step reducing all selected time steps)"
+    ),
+    metavar="N",
+)
+parser.add_argument(
+    "--processes",
+    type=int,
+    default=1,
+    help=(
+        "number of processes writing the variables (or blocks of time steps) in"
+        " parallel. With hdf5, each writes to a file of the folder prefix_parts,"
+        " stitched in prefix.h5 by virtual datasets (requires hdf5>=1.10 to read)"
+    ),
+)
+parser.add_argument(
+    "--shuffle",
+    action="store_true",
+    help="byte-shuffle the data before compression (for hdf5 format only)",
+)
+parser.add_argument(
+    "--chunks",
+    nargs=2,
+    type=int,
+    metavar=("nsteps", "ncells"),
+    help="chunk shape of the hdf5 datasets (default: chosen by h5py)",
+)
+parser.add_argument(
+    "--cellMajor",
+    action="store_true",
+    help=(
+        "store the data in chunks spanning all time steps of a few cells (for hdf5"
+        " format only), for fast reading of the time series of individual cells"
+    ),
+)
+parser.add_argument(
+    "--sharedMesh",
+    action="store_true",
+    help=(
+        "define the mesh once in the xdmf file, referenced by each time step"
+        " (smaller xdmf file, faster to parse)"
+    ),
 )
 parser.add_argument(
     "--time",
@@ -100,6 +175,41 @@ parser.add_argument(
     metavar=("comma_separated_tags"),
     help="filter cells by faultTag (fault output), or locationFlag (surface output)",
 )
+parser.add_argument(
+    "--stations",
+    metavar="stations_file",
+    help=(
+        "text file with the x y z coordinates of stations (one per line). The time"
+        " series of the variables at the stations are extracted (only reading the"
+        " cells near the stations) into a hdf5 file of arrays (nstations, ntimes)"
+    ),
+)
+parser.add_argument(
+    "--interpolation",
+    type=str,
+    choices=["barycentric", "cell"],
+    default="barycentric",
+    help=(
+        "interpolation at the stations: value of the cell containing the station, or"
+        " barycentric interpolation of the cell values averaged at the nodes"
+    ),
+)
+parser.add_argument(
+    "--keepAllVertices",
+    action="store_true",
+    help=(
+        "when filtering cells, write all the vertices of the mesh (by default only"
+        " the vertices of the filtered cells are written)"
+    ),
+)
+parser.add_argument(
+    "--cacheSpatialIndex",
+    action="store_true",
+    help=(
+        "store the spatial index of the cell centers used for filtering in the"
+        " working directory, to speed up subsequent extractions"
+    ),
+)
 
 args = parser.parse_args()
 
@@ -137,27 +247,15 @@ class SeissolxdmfExtended(seissolxdmf.seissolxdmf):
                         lidt.append(new_index)
         return sorted(list(set(lidt)))
 
-    def ReadData(self, dataName, idt=-1):
-        if dataName == "SR" and "SR" not in self.ReadAvailableDataFields():
-            SRs = super().ReadData("SRs", idt)
-            SRd = super().ReadData("SRd", idt)
-            return np.sqrt(SRs**2 + SRd**2)
-        else:
-            return super().ReadData(dataName, idt)
-
-    def GetDataLocationPrecisionMemDimension(self, dataName):
-        if dataName == "SR" and "SR" not in self.ReadAvailableDataFields():
-            return super().GetDataLocationPrecisionMemDimension("SRs")
-        else:
-            return super().GetDataLocationPrecisionMemDimension(dataName)
-
-    def GetFilteredCells(self, regionFilter, xRange, yRange, zRange):
+    def GetFilteredCells(
+        self, regionFilter, xRange, yRange, zRange, spatial_index_cache=None
+    ):
         spatial_filtering = (xRange or yRange) or zRange
         filter_cells = spatial_filtering or regionFilter
         if not filter_cells:
             return slice(None)
 
-        ids = range(0, self.nElements)
+        ids = np.arange(self.nElements)
 
         if regionFilter:
             available = self.ReadAvailableDataFields()
@@ -182,31 +280,16 @@ class SeissolxdmfExtended(seissolxdmf.seissolxdmf):
                 raise ValueError(
                     "Error: All elements in regionFilter must be integers."
                 )
-            ids = [v for v in ids if tags[v] in regions]
+            ids = np.nonzero(np.isin(tags, list(regions)))[0]
             print(f"cell count after region filtering: {len(ids)}/{self.nElements}")
 
         if spatial_filtering:
-            xyz = self.ReadGeometry()
-            connect = self.ReadConnect()
-            warn("spatial filtering significantly slows down this script")
-            xyzc = (
-                xyz[connect[:, 0], :] + xyz[connect[:, 1], :] + xyz[connect[:, 2], :]
-            ) / 3.0
-
-            def filter_cells(coords, filter_range):
-                m = 0.5 * (filter_range[0] + filter_range[1])
-                d = 0.5 * (filter_range[1] - filter_range[0])
-                return np.where(np.abs(coords[:] - m) < d)[0]
-
-            if xRange:
-                id0 = filter_cells(xyzc[:, 0], xRange)
-                ids = np.intersect1d(ids, id0)
-            if yRange:
-                id0 = filter_cells(xyzc[:, 1], yRange)
-                ids = np.intersect1d(ids, id0)
-            if zRange:
-                id0 = filter_cells(xyzc[:, 2], zRange)
-                ids = np.intersect1d(ids, id0)
+            spatial_index = self.GetSpatialIndex(spatial_index_cache)
+            ranges = [xRange, yRange, zRange]
+            lower = [r[0] if r else -np.inf for r in ranges]
+            upper = [r[1] if r else np.inf for r in ranges]
+            id0 = spatial_index.QueryBox(lower, upper)
+            ids = np.intersect1d(ids, id0, assume_unique=True)
 
             print(f"cell count after spatial filtering: {len(ids)}/{self.nElements}")
         if not len(ids):
@@ -216,11 +299,16 @@ class SeissolxdmfExtended(seissolxdmf.seissolxdmf):
 
 def main():
     sx = SeissolxdmfExtended(args.xdmfFilename)
-    ids = sx.GetFilteredCells(args.regionFilter, args.xRange, args.yRange, args.zRange)
+    prefix = os.path.splitext(args.xdmfFilename)[0]
+    spatial_index_cache = None
+    if args.cacheSpatialIndex:
+        spatial_index_cache = os.path.basename(prefix) + "-spatial-index.npz"
+    ids = sx.GetFilteredCells(
+        args.regionFilter, args.xRange, args.yRange, args.zRange, spatial_index_cache
+    )
 
     indices = sx.ComputeTimeIndices(args.time[0].split(","))
 
-    prefix = os.path.splitext(args.xdmfFilename)[0]
     prefix_new = generate_new_prefix(prefix, args.add2prefix)
 
     # Write data items
@@ -228,11 +316,50 @@ def main():
         args.variables = sorted(sx.ReadAvailableDataFields())
         print(f"args.variables was set to all and now contains {args.variables}")
 
-    if args.backend == "hdf5" and args.compression > 0:
+    if args.stations:
+        stations = np.loadtxt(args.stations, ndmin=2)
+        var_names = [name for name in args.variables if sx[name].ndim == 2]
+        if len(var_names) < len(args.variables):
+            print(f"time independent variables ignored, extracting {var_names}")
+        sxw.write_stations_from_seissol_output(
+            prefix_new + "-stations",
+            sx,
+            var_names,
+            indices,
+            stations,
+            interpolation=args.interpolation,
+            reduce_precision=args.precision == "float",
+            compression_level=args.compression,
+            spatial_index=sx.GetSpatialIndex(spatial_index_cache),
+            codec=args.codec,
+            shuffle=args.shuffle,
+        )
+        return
+
+    if args.reduce:
+        sxw.write_reduced_from_seissol_output(
+            generate_new_prefix(prefix, f"{args.add2prefix}_{args.reduce}"),
+            sx,
+            args.variables,
+            indices,
+            args.reduce,
+            window=args.window,
+            reduce_precision=True,
+            backend=args.backend,
+            compression_level=args.compression,
+            filtered_cells=ids,
+            codec=args.codec,
+            shuffle=args.shuffle,
+            shared_mesh=args.sharedMesh,
+            compact_mesh=not args.keepAllVertices,
+        )
+        return
+
+    if args.backend == "hdf5" and args.codec == "gzip" and args.compression > 0:
         print(
             "Writing hdf5 output with compression enabled"
             f" (compression_level={args.compression}). \n"
-            "Use --compression=0 if you want to speed-up data extraction."
+            "Use --codec=lzf or --compression=0 if you want to speed-up data extraction."
         )
 
     sxw.write_from_seissol_output(
@@ -244,6 +371,14 @@ def main():
         backend=args.backend,
         compression_level=args.compression,
         filtered_cells=ids,
+        cell_major=args.cellMajor,
+        codec=args.codec,
+        shuffle=args.shuffle,
+        chunks=args.chunks,
+        compression_threads=args.threads,
+        shared_mesh=args.sharedMesh,
+        compact_mesh=not args.keepAllVertices,
+        n_processes=args.processes,
     )
 
 
@@ -1,5 +1,8 @@
+import collections
 import os
 import sys
+import time
+import zlib
 
 import numpy as np
 from tqdm import tqdm
@@ -43,64 +46,121 @@ def compile_dictDataTypes(dictData, reduce_precision):
     return dictDataTypes
 
 
-def write_timeseries_xdmf(
+def mesh_xdmf(nNodes, nCells, node_per_element, bn_prefix, backend, indent):
+    """Topology and Geometry elements of the mesh"""
+    data_format = "HDF" if backend == "hdf5" else "Binary"
+    topology = "Tetrahedron" if node_per_element == 4 else "Triangle"
+    geometry_location = dataLocation(bn_prefix, "geometry", backend)
+    connect_location = dataLocation(bn_prefix, "connect", backend)
+    return f"""
+{indent}<Topology TopologyType="{topology}" NumberOfElements="{nCells}">
+{indent} <DataItem NumberType="Int" Precision="8" Format="{data_format}" Dimensions="{nCells} {node_per_element}">{connect_location}</DataItem>
+{indent}</Topology>
+{indent}<Geometry name="geo" GeometryType="XYZ" NumberOfElements="{nNodes}">
+{indent} <DataItem NumberType="Float" Precision="8" Format="{data_format}" Dimensions="{nNodes} 3">{geometry_location}</DataItem>
+{indent}</Geometry>"""
+
+
+def timeseries_xdmf_header(
+    prefix, nNodes, nCells, node_per_element, backend, shared_mesh=False
+):
+    """beginning of a time series xdmf file, up to the first time step
+    shared_mesh: the mesh is defined once, and referenced by each time step"""
+    bn_prefix = os.path.basename(prefix)
+    xdmf = """<?xml version="1.0" ?>
+<!DOCTYPE Xdmf SYSTEM "Xdmf.dtd" []>
+<Xdmf Version="2.0">
+ <Domain>"""
+    if shared_mesh:
+        xdmf += mesh_xdmf(nNodes, nCells, node_per_element, bn_prefix, backend, "  ")
+    return xdmf + """
+  <Grid Name="TimeSeries" GridType="Collection" CollectionType="Temporal">"""
+
+
+timeseries_xdmf_footer = """
+  </Grid>
+ </Domain>
+</Xdmf>
+"""
+
+
+def timeseries_xdmf_step(
     prefix,
+    i,
+    ctime,
     nNodes,
     nCells,
     node_per_element,
     dictDataTypes,
-    timeValues,
-    reduce_precision,
     backend,
+    shared_mesh=False,
 ):
+    """Grid element of the time step i, at time ctime"""
     bn_prefix = os.path.basename(prefix)
     data_format = "HDF" if backend == "hdf5" else "Binary"
-    lDataName = list(dictDataTypes.keys())
-    lDataTypes = list(dictDataTypes.values())
-    topology = "Tetrahedron" if node_per_element == 4 else "Triangle"
-    xdmf = """<?xml version="1.0" ?>
-<!DOCTYPE Xdmf SYSTEM "Xdmf.dtd" []>
-<Xdmf Version="2.0">
- <Domain>
-  <Grid Name="TimeSeries" GridType="Collection" CollectionType="Temporal">"""
-    geometry_location = dataLocation(bn_prefix, "geometry", backend)
-    connect_location = dataLocation(bn_prefix, "connect", backend)
-
-    for i, ctime in enumerate(timeValues):
-        xdmf += f"""
-   <Grid Name="step_{i}" GridType="Uniform">
-    <Topology TopologyType="{topology}" NumberOfElements="{nCells}">
-     <DataItem NumberType="Int" Precision="8" Format="{data_format}" Dimensions="{nCells} {node_per_element}">{connect_location}</DataItem>
-    </Topology>
-    <Geometry name="geo" GeometryType="XYZ" NumberOfElements="{nNodes}">
-     <DataItem NumberType="Float" Precision="8" Format="{data_format}" Dimensions="{nNodes} 3">{geometry_location}</DataItem>
-    </Geometry>
-    <Time Value="{ctime}"/>"""
-        for k, dataName in enumerate(list(dictDataTypes.keys())):
-            data_location = dataLocation(bn_prefix, dataName, backend)
-            prec, number_type = dictDataTypes[dataName]
-            if dataName in known_1d_arrays:
-                xdmf += f"""
+    if shared_mesh:
+        mesh = """
+    <Topology Reference="/Xdmf/Domain/Topology[1]"/>
+    <Geometry Reference="/Xdmf/Domain/Geometry[1]"/>"""
+    else:
+        mesh = mesh_xdmf(nNodes, nCells, node_per_element, bn_prefix, backend, "    ")
+    xdmf = [f"""
+   <Grid Name="step_{i}" GridType="Uniform">{mesh}
+    <Time Value="{ctime}"/>"""]
+    for dataName, (prec, number_type) in dictDataTypes.items():
+        data_location = dataLocation(bn_prefix, dataName, backend)
+        if dataName in known_1d_arrays:
+            xdmf.append(f"""
     <Attribute Name="{dataName}" Center="Cell">
      <DataItem NumberType="{number_type}" Precision="{prec}" Format="{data_format}" Dimensions="1 {nCells}">{data_location}</DataItem>
-    </Attribute>"""
-            else:
-                xdmf += f"""
+    </Attribute>""")
+        else:
+            xdmf.append(f"""
     <Attribute Name="{dataName}" Center="Cell">
      <DataItem ItemType="HyperSlab" Dimensions="{nCells}">
       <DataItem NumberType="UInt" Precision="4" Format="XML" Dimensions="3 2">{i} 0 1 1 1 {nCells}</DataItem>
       <DataItem NumberType="{number_type}" Precision="{prec}" Format="{data_format}" Dimensions="{i+1} {nCells}">{data_location}</DataItem>
      </DataItem>
-    </Attribute>"""
-        xdmf += """
-   </Grid>"""
-    xdmf += """
-  </Grid>
- </Domain>
-</Xdmf>
-"""
+    </Attribute>""")
+    xdmf.append("""
+   </Grid>""")
+    return "".join(xdmf)
+
+
+def write_timeseries_xdmf(
+    prefix,
+    nNodes,
+    nCells,
+    node_per_element,
+    dictDataTypes,
+    timeValues,
+    reduce_precision,
+    backend,
+    shared_mesh=False,
+):
+    """write the xdmf file of a time series, streamed time step after time step
+    shared_mesh: the mesh is defined once, and referenced by each time step"""
     with open(prefix + ".xdmf", "w") as fid:
-        fid.write(xdmf)
+        fid.write(
+            timeseries_xdmf_header(
+                prefix, nNodes, nCells, node_per_element, backend, shared_mesh
+            )
+        )
+        for i, ctime in enumerate(timeValues):
+            fid.write(
+                timeseries_xdmf_step(
+                    prefix,
+                    i,
+                    ctime,
+                    nNodes,
+                    nCells,
+                    node_per_element,
+                    dictDataTypes,
+                    backend,
+                    shared_mesh,
+                )
+            )
+        fid.write(timeseries_xdmf_footer)
     print(f"done writing {prefix}.xdmf")
     full_path = os.path.abspath(f"{prefix}.xdmf")
     print(f"full path: {full_path}")
@@ -173,24 +233,482 @@ def output_type(input_array, reduce_precision):
     return mydtype
 
 
+# hdf5 filters provided by hdf5plugin (if installed)
+hdf5plugin_codecs = {
+    "zstd": "Zstd",
+    "lz4": "LZ4",
+    "blosc": "Blosc",
+    "blosc2": "Blosc2",
+    "bzip2": "BZip2",
+    "bitshuffle": "Bitshuffle",
+}
+
+
+def hdf5_compression_options(codec="gzip", compression_level=4, shuffle=False):
+    """keyword arguments of h5py create_dataset compressing with codec:
+    gzip (at compression_level, no compression if 0), lzf, none, the name of a
+    filter of hdf5plugin (e.g. zstd, if installed) or the id of a hdf5 filter
+    available (e.g. 32015). shuffle: byte-shuffle the data before compression"""
+    import h5py
+
+    compression_options = {}
+    if codec == "gzip":
+        if compression_level:
+            compression_options = {
+                "compression": "gzip",
+                "compression_opts": compression_level,
+            }
+    elif codec == "lzf":
+        compression_options = {"compression": "lzf"}
+    elif codec.lower() in hdf5plugin_codecs:
+        try:
+            import hdf5plugin
+        except ImportError:
+            raise ValueError(
+                f"codec {codec} requires hdf5plugin (pip install hdf5plugin)"
+            )
+        compression_options = dict(
+            getattr(hdf5plugin, hdf5plugin_codecs[codec.lower()])()
+        )
+    elif codec.isdigit() and h5py.h5z.filter_avail(int(codec)):
+        compression_options = {"compression": int(codec)}
+    elif codec != "none":
+        raise ValueError(
+            f"unknown or unavailable codec {codec}, should be gzip, lzf, none,"
+            f" one of {list(hdf5plugin_codecs)} (with hdf5plugin) or a hdf5 filter id"
+        )
+    if shuffle:
+        compression_options["shuffle"] = True
+    return compression_options
+
+
+def hdf5_chunk_options(chunks, shape):
+    """chunks option of h5py create_dataset, clipped to shape
+    (h5py default chunking if chunks is None)"""
+    if chunks is None:
+        return {}
+    return {"chunks": tuple(max(1, min(c, n)) for c, n in zip(chunks, shape))}
+
+
+def report_hdf5_dataset(dset, elapsed):
+    """print the write throughput and compression ratio of dset"""
+    raw_bytes = dset.size * dset.dtype.itemsize
+    stored_bytes = dset.id.get_storage_size()
+    ratio = (
+        f", compression ratio {raw_bytes / stored_bytes:.2f}" if stored_bytes else ""
+    )
+    print(
+        f"{dset.name}: {raw_bytes / 1e6:.1f} MB written in {elapsed:.2f} s"
+        f" ({raw_bytes / 1e6 / max(elapsed, 1e-9):.1f} MB/s){ratio}"
+    )
+
+
 def write_one_arr_hdf5(h5f, ar_name, ar_data, compression_options):
-    h5f.create_dataset(
+    dset = h5f.create_dataset(
         f"/{ar_name}", ar_data.shape, dtype=ar_data.dtype, **compression_options
     )
-    if len(ar_data.shape) == 1:
-        h5f[f"/{ar_name}"][:] = ar_data
-    else:
-        h5f[f"/{ar_name}"][:, :] = ar_data
+    dset[...] = ar_data
     return ar_data.shape
 
 
+def rows_per_block(dset, block_bytes=2**26):
+    """number of rows of about block_bytes written at once in dset,
+    a multiple of the number of rows of its chunks"""
+    row_bytes = max(1, dset.shape[1] * dset.dtype.itemsize)
+    chunk_rows = dset.chunks[0] if dset.chunks else 1
+    return chunk_rows * max(1, block_bytes // (chunk_rows * row_bytes))
+
+
+def is_unfiltered(filtered_cells):
+    return isinstance(filtered_cells, slice) and filtered_cells == slice(None)
+
+
 def infer_n_elements(sx, filtered_cells):
-    if isinstance(filtered_cells, slice) and filtered_cells == slice(None):
+    if is_unfiltered(filtered_cells):
         return sx.ReadNElements()
     else:
         return len(filtered_cells)
 
 
+def iterate_time_steps(sx, ar_name, time_indices, filtered_cells):
+    """iterate over (i, (idt, my_array)) for the filtered cells of ar_name,
+    the next time steps being read in the background while writing"""
+    cells = None if is_unfiltered(filtered_cells) else filtered_cells
+    return enumerate(
+        tqdm(
+            sx.IterTimeSteps(ar_name, time_indices, cells, fillValue=np.nan),
+            total=len(time_indices),
+            file=sys.stdout,
+            desc=ar_name,
+            dynamic_ncols=False,
+        )
+    )
+
+
+def cell_major_chunks(n_steps, nel, itemsize, chunk_bytes=2**20):
+    """chunk shape (time steps, cells) of about chunk_bytes spanning all time steps
+    (or as many as fit), so that the time series of a cell is read in few chunks"""
+    n_steps_chunk = max(1, min(n_steps, chunk_bytes // itemsize))
+    n_cells_chunk = max(1, min(nel, chunk_bytes // (n_steps_chunk * itemsize)))
+    return (n_steps_chunk, n_cells_chunk)
+
+
+def read_cell_slab(sx, ar_name, time_indices, cells):
+    """read all time steps of cells, time steps that cannot be read
+    (e.g. of an interrupted simulation) being filled with NaN"""
+    try:
+        return sx.ReadDataCells(ar_name, cells, time_indices)
+    except IndexError:
+        slab = np.full((len(time_indices), len(cells)), np.nan)
+        for i, (idt, my_array) in enumerate(
+            sx.IterTimeSteps(ar_name, time_indices, cells, fillValue=np.nan)
+        ):
+            slab[i, :] = my_array
+        return slab
+
+
+def write_cell_major_hdf5(
+    h5f,
+    sx,
+    ar_name,
+    time_indices,
+    filtered_cells,
+    reduce_precision,
+    compression_options,
+    slab_memory=2**28,
+    chunks=None,
+):
+    """write ar_name in chunks spanning the time steps of a few cells (or of shape chunks),
+    streaming slabs of cells (all time steps) of at most about slab_memory bytes"""
+    cells = np.arange(sx.ReadNElements())
+    if not is_unfiltered(filtered_cells):
+        cells = np.asarray(filtered_cells)
+    n_steps = len(time_indices)
+    if not n_steps:
+        return
+    mydtype = np.dtype(output_type(np.empty(0, sx[ar_name].dtype), reduce_precision))
+    if chunks is None:
+        chunks = cell_major_chunks(n_steps, len(cells), mydtype.itemsize)
+    chunks = hdf5_chunk_options(chunks, (n_steps, len(cells)))["chunks"]
+    dset = h5f.create_dataset(
+        f"/{ar_name}",
+        (n_steps, len(cells)),
+        dtype=mydtype,
+        chunks=chunks,
+        **compression_options,
+    )
+    start = time.perf_counter()
+    # slabs aligned with the chunks
+    slab_cells = chunks[1] * max(1, slab_memory // (chunks[1] * n_steps * 8))
+    for first in tqdm(
+        range(0, len(cells), slab_cells),
+        file=sys.stdout,
+        desc=ar_name,
+        dynamic_ncols=False,
+    ):
+        slab_ids = cells[first : first + slab_cells]
+        dset[:, first : first + len(slab_ids)] = read_cell_slab(
+            sx, ar_name, time_indices, slab_ids
+        )
+    report_hdf5_dataset(dset, time.perf_counter() - start)
+
+
+def compress_chunk(block, first_cell, chunks, compression_level, shuffle):
+    """deflate the chunk of block (rows of a block of time steps) starting at first_cell,
+    as the hdf5 shuffle and deflate filters would do (edge chunks being zero-padded)"""
+    chunk = np.zeros(chunks, dtype=block.dtype)
+    my_array = block[:, first_cell : first_cell + chunks[1]]
+    chunk[: my_array.shape[0], : my_array.shape[1]] = my_array
+    if shuffle and chunk.dtype.itemsize > 1:
+        chunk = chunk.reshape(-1).view(np.uint8).reshape(-1, chunk.dtype.itemsize)
+        chunk = np.ascontiguousarray(chunk.T)
+    return zlib.compress(chunk, compression_level)
+
+
+def write_compressed_time_steps_hdf5(
+    h5f,
+    sx,
+    ar_name,
+    time_indices,
+    filtered_cells,
+    reduce_precision,
+    compression_level,
+    shuffle,
+    chunks=None,
+    n_threads=None,
+):
+    """write the time steps of ar_name compressed with gzip, in a pipeline:
+    the next time steps are read in the background (see iterate_time_steps),
+    the chunks are compressed by a pool of n_threads threads (zlib releasing the GIL),
+    and the compressed chunks are written with direct chunk writes"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    n_steps = len(time_indices)
+    nel = infer_n_elements(sx, filtered_cells)
+    if not n_steps:
+        return
+    mydtype = np.dtype(output_type(np.empty(0, sx[ar_name].dtype), reduce_precision))
+    if chunks is None:
+        chunks = (1, 2**20 // mydtype.itemsize)
+    chunks = hdf5_chunk_options(chunks, (n_steps, max(1, nel)))["chunks"]
+    dset = h5f.create_dataset(
+        f"/{ar_name}",
+        (n_steps, nel),
+        dtype=mydtype,
+        chunks=chunks,
+        compression="gzip",
+        compression_opts=compression_level,
+        shuffle=shuffle,
+    )
+    n_threads = n_threads or os.cpu_count() or 1
+    # compressed chunks in flight, bounding the memory used
+    max_pending = 4 * n_threads
+    pending = collections.deque()
+
+    def write_oldest():
+        offset, future = pending.popleft()
+        dset.id.write_direct_chunk(offset, future.result())
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(n_threads) as pool:
+        for i, (idt, my_array) in iterate_time_steps(
+            sx, ar_name, time_indices, filtered_cells
+        ):
+            if i % chunks[0] == 0:
+                # a new block, the previous one being referenced by the pending chunks
+                block = np.zeros((min(chunks[0], n_steps - i), nel), dtype=mydtype)
+            block[i % chunks[0], :] = my_array
+            if i % chunks[0] < block.shape[0] - 1:
+                continue
+            first_step = i - i % chunks[0]
+            for first_cell in range(0, nel, chunks[1]):
+                future = pool.submit(
+                    compress_chunk,
+                    block,
+                    first_cell,
+                    chunks,
+                    compression_level,
+                    shuffle,
+                )
+                pending.append(((first_step, first_cell), future))
+                while len(pending) > max_pending:
+                    write_oldest()
+        while pending:
+            write_oldest()
+    report_hdf5_dataset(dset, time.perf_counter() - start)
+
+
+def write_time_steps_hdf5(
+    h5f,
+    sx,
+    ar_name,
+    time_indices,
+    filtered_cells,
+    reduce_precision,
+    compression_options,
+    chunks=None,
+):
+    """write the time steps of ar_name, accumulated in blocks of rows
+    aligned with the chunks, each block being written with a single call"""
+    n_steps = len(time_indices)
+    nel = infer_n_elements(sx, filtered_cells)
+    if not n_steps:
+        return
+    mydtype = np.dtype(output_type(np.empty(0, sx[ar_name].dtype), reduce_precision))
+    dset = h5f.create_dataset(
+        f"/{ar_name}",
+        (n_steps, nel),
+        dtype=mydtype,
+        **hdf5_chunk_options(chunks, (n_steps, nel)),
+        **compression_options,
+    )
+    block = np.empty((min(rows_per_block(dset), n_steps), nel), dtype=mydtype)
+    start = time.perf_counter()
+    for i, (idt, my_array) in iterate_time_steps(
+        sx, ar_name, time_indices, filtered_cells
+    ):
+        block[i % block.shape[0], :] = my_array
+        if i % block.shape[0] == block.shape[0] - 1 or i == n_steps - 1:
+            first_step = i - i % block.shape[0]
+            dset[first_step : i + 1, :] = block[: i + 1 - first_step]
+    report_hdf5_dataset(dset, time.perf_counter() - start)
+
+
+def read_mesh(sx, filtered_cells, compact_mesh):
+    """geometry and connect of the filtered cells
+    compact_mesh: only keep the vertices of the filtered cells, renumbered in connect"""
+    xyz = sx.ReadGeometry()
+    connect = sx.ReadConnect()[filtered_cells, :]
+    if compact_mesh and not is_unfiltered(filtered_cells):
+        used = np.unique(connect)
+        new_ids = np.zeros(xyz.shape[0], dtype=connect.dtype)
+        new_ids[used] = np.arange(used.size)
+        connect = new_ids[connect]
+        xyz = xyz[used]
+    return xyz, connect
+
+
+def write_temporal_array_hdf5(
+    h5f,
+    sx,
+    ar_name,
+    time_indices,
+    filtered_cells,
+    reduce_precision,
+    compression_level,
+    codec="gzip",
+    shuffle=False,
+    chunks=None,
+    cell_major=False,
+    compression_threads=None,
+):
+    """write the time steps time_indices of the array ar_name of sx into h5f,
+    with the fastest writer for the layout and codec"""
+    if cell_major:
+        compression_options = hdf5_compression_options(
+            codec, compression_level, shuffle
+        )
+        write_cell_major_hdf5(
+            h5f,
+            sx,
+            ar_name,
+            time_indices,
+            filtered_cells,
+            reduce_precision,
+            compression_options,
+            chunks=chunks,
+        )
+    elif codec == "gzip" and compression_level:
+        write_compressed_time_steps_hdf5(
+            h5f,
+            sx,
+            ar_name,
+            time_indices,
+            filtered_cells,
+            reduce_precision,
+            compression_level,
+            shuffle,
+            chunks,
+            compression_threads,
+        )
+    else:
+        compression_options = hdf5_compression_options(
+            codec, compression_level, shuffle
+        )
+        write_time_steps_hdf5(
+            h5f,
+            sx,
+            ar_name,
+            time_indices,
+            filtered_cells,
+            reduce_precision,
+            compression_options,
+            chunks,
+        )
+
+
+def write_temporal_array_raw(
+    filename, sx, ar_name, time_indices, filtered_cells, reduce_precision
+):
+    """write the time steps time_indices of the array ar_name of sx
+    into the binary file filename"""
+    with open(filename, "wb") as fid:
+        for i, (idt, my_array) in iterate_time_steps(
+            sx, ar_name, time_indices, filtered_cells
+        ):
+            if i == 0:
+                mydtype = output_type(my_array, reduce_precision)
+            my_array[:].astype(mydtype).tofile(fid)
+
+
+def part_tasks(prefix, array_names, time_indices, n_processes, backend, cells=None):
+    """split the writing of the temporal arrays into tasks
+    (filename, ar_name, time_indices, part_cells) of worker processes: one per
+    array or, with more processes than arrays (hdf5 only), one per block of
+    time steps of each array (part_cells being None), or one per block of
+    cells if cells (the ids of the filtered cells) is given, so that the
+    chunks of cell-major arrays still span all time steps"""
+    time_indices = list(time_indices)
+    if backend != "hdf5":
+        return [
+            (f"{prefix}/{ar_name}.bin", ar_name, time_indices, None)
+            for ar_name in array_names
+        ]
+    n_items = len(time_indices) if cells is None else len(cells)
+    n_blocks = max(1, min(n_items, -(-n_processes // len(array_names))))
+    bounds = np.linspace(0, n_items, n_blocks + 1).astype(int)
+    tasks = []
+    for ar_name in array_names:
+        for k in range(n_blocks):
+            filename = f"{prefix}_parts/{ar_name}_{k}.h5"
+            if cells is None:
+                block = time_indices[bounds[k] : bounds[k + 1]]
+                tasks.append((filename, ar_name, block, None))
+            else:
+                block = cells[bounds[k] : bounds[k + 1]]
+                tasks.append((filename, ar_name, time_indices, block))
+    return tasks
+
+
+# state of the worker processes of write_data_from_seissolxdmf
+_part_worker = {}
+
+
+def _init_part_worker(pickled_sx, filtered_cells, backend, options):
+    import pickle
+
+    _part_worker["sx"] = pickle.loads(pickled_sx)
+    _part_worker["args"] = (filtered_cells, backend, options)
+
+
+def _write_part_worker(task):
+    filename, ar_name, time_indices, part_cells = task
+    filtered_cells, backend, options = _part_worker["args"]
+    if part_cells is not None:
+        filtered_cells = part_cells
+    sx = _part_worker["sx"]
+    if backend != "hdf5":
+        write_temporal_array_raw(
+            filename,
+            sx,
+            ar_name,
+            time_indices,
+            filtered_cells,
+            options["reduce_precision"],
+        )
+        return task, None
+    import h5py
+
+    with h5py.File(filename, "w") as h5f:
+        write_temporal_array_hdf5(
+            h5f, sx, ar_name, time_indices, filtered_cells, **options
+        )
+        return task, (h5f[ar_name].shape, h5f[ar_name].dtype)
+
+
+def write_virtual_dataset_hdf5(h5f, ar_name, parts, axis=0):
+    """stitch the blocks parts [(filename, shape, dtype)] of ar_name, written by the
+    worker processes, along axis (0: time steps, 1: cells) into a virtual dataset of h5f
+    """
+    import h5py
+
+    shape = list(parts[0][1])
+    shape[axis] = sum(part_shape[axis] for _, part_shape, _ in parts)
+    layout = h5py.VirtualLayout(shape=tuple(shape), dtype=parts[0][2])
+    # relative to the folder of h5f, where hdf5 looks for the source files
+    folder = os.path.dirname(os.path.abspath(h5f.filename))
+    i0 = 0
+    for filename, part_shape, _ in parts:
+        source = h5py.VirtualSource(
+            os.path.relpath(filename, folder), ar_name, shape=part_shape
+        )
+        selection = [slice(None)] * len(shape)
+        selection[axis] = slice(i0, i0 + part_shape[axis])
+        layout[tuple(selection)] = source
+        i0 += part_shape[axis]
+    h5f.create_virtual_dataset(ar_name, layout)
+
+
 def write_data_from_seissolxdmf(
     prefix,
     sx,
@@ -201,59 +719,98 @@ def write_data_from_seissolxdmf(
     backend,
     compression_level,
     filtered_cells,
+    cell_major=False,
+    codec="gzip",
+    shuffle=False,
+    chunks=None,
+    compression_threads=None,
+    compact_mesh=False,
+    n_processes=1,
 ):
+    """write the data of sx into prefix.h5 (or the folder prefix for the raw backend)
+    compact_mesh: only write the vertices of the filtered cells
+    n_processes: number of worker processes writing the temporal arrays. With hdf5,
+    each writes its arrays (or blocks of time steps, of cells if cell_major) into a file of the folder
+    prefix_parts, and prefix.h5 stitches them in virtual datasets
+    returns the number of vertices written"""
+    geometry, connect = read_mesh(sx, filtered_cells, compact_mesh)
+
     def read_non_temporal(sx, ar_name, filtered_cells):
         if ar_name == "geometry":
-            return sx.ReadGeometry()
+            return geometry
         elif ar_name == "connect":
-            return sx.ReadConnect()[filtered_cells, :]
+            return connect
         else:
             return sx.Read1dData(ar_name, sx.nElements, isInt=True)[filtered_cells]
 
-    nel = infer_n_elements(sx, filtered_cells)
+    options = {
+        "reduce_precision": reduce_precision,
+        "compression_level": compression_level,
+        "codec": codec,
+        "shuffle": shuffle,
+        "chunks": chunks,
+        "cell_major": cell_major,
+        "compression_threads": compression_threads,
+    }
     if backend == "hdf5":
-        import h5py
+        compression_options = hdf5_compression_options(
+            codec, compression_level, shuffle
+        )
+    pool = None
+    if n_processes > 1 and array_names and len(time_indices):
+        import multiprocessing
+        import pickle
 
-        compression_options = {}
-        if compression_level:
-            compression_options = {
-                "compression": "gzip",
-                "compression_opts": compression_level,
-            }
+        if compression_threads is None:
+            options["compression_threads"] = max(
+                1, (os.cpu_count() or 1) // n_processes
+            )
+        os.makedirs(prefix + "_parts" if backend == "hdf5" else prefix, exist_ok=True)
+        cells = None
+        if cell_major:
+            cells = np.arange(sx.ReadNElements())
+            if not is_unfiltered(filtered_cells):
+                cells = np.asarray(filtered_cells)
+        tasks = part_tasks(
+            prefix, array_names, time_indices, n_processes, backend, cells
+        )
+        pool = multiprocessing.Pool(
+            min(n_processes, len(tasks)),
+            initializer=_init_part_worker,
+            initargs=(pickle.dumps(sx), filtered_cells, backend, options),
+        )
+        # the workers write the temporal arrays while the mesh is written
+        results = pool.map_async(_write_part_worker, tasks)
+
+    if backend == "hdf5":
+        import h5py
 
         with h5py.File(prefix + ".h5", "w") as h5f:
             for ar_name in non_temporal_array_names:
                 my_array = read_non_temporal(sx, ar_name, filtered_cells)
                 write_one_arr_hdf5(h5f, ar_name, my_array, compression_options)
-            for ar_name in array_names:
-                for i, idt in enumerate(
-                    tqdm(
+            if pool is None:
+                for ar_name in array_names:
+                    write_temporal_array_hdf5(
+                        h5f,
+                        sx,
+                        ar_name,
                         time_indices,
-                        file=sys.stdout,
-                        desc=ar_name,
-                        dynamic_ncols=False,
+                        filtered_cells,
+                        **options,
+                    )
+            else:
+                parts = {ar_name: [] for ar_name in array_names}
+                try:
+                    for task, (shape, dtype) in results.get():
+                        filename, ar_name = task[:2]
+                        parts[ar_name].append((filename, shape, dtype))
+                finally:
+                    pool.terminate()
+                for ar_name in array_names:
+                    write_virtual_dataset_hdf5(
+                        h5f, ar_name, parts[ar_name], axis=1 if cell_major else 0
                     )
-                ):
-                    try:
-                        my_array = sx.ReadData(ar_name, idt)[filtered_cells]
-                    except IndexError:
-                        print(
-                            f"time step {idt} of {ar_name} is corrupted, replacing with nans"
-                        )
-                        my_array = np.full(nel, np.nan)
-                    if i == 0:
-                        h5f.create_dataset(
-                            f"/{ar_name}",
-                            (len(time_indices), nel),
-                            dtype=str(output_type(my_array, reduce_precision)),
-                            **compression_options,
-                        )
-                    if my_array.shape[0] == 0:
-                        print(
-                            f"time step {idt} of {ar_name} is corrupted, replacing with nans"
-                        )
-                        my_array = np.full(nel, np.nan)
-                    h5f[f"/{ar_name}"][i, :] = my_array[:]
         print(f"done writing {prefix}.h5")
     else:
         os.makedirs(prefix, exist_ok=True)
@@ -261,26 +818,23 @@ def write_data_from_seissolxdmf(
             my_array = read_non_temporal(sx, ar_name, filtered_cells)
             with open(f"{prefix}/{ar_name}.bin", "wb") as fid:
                 my_array.tofile(fid)
-        for ar_name in array_names:
-            with open(f"{prefix}/{ar_name}.bin", "wb") as fid:
-                for i, idt in enumerate(
-                    tqdm(
-                        time_indices,
-                        file=sys.stdout,
-                        desc=ar_name,
-                        dynamic_ncols=False,
-                    )
-                ):
-                    my_array = sx.ReadData(ar_name, idt)[filtered_cells]
-                    if my_array.shape[0] == 0:
-                        print(
-                            f"time step {idt} of {ar_name} is corrupted, replacing with nans"
-                        )
-                        my_array = np.full(nel, np.nan)
-                    if i == 0:
-                        mydtype = output_type(my_array, reduce_precision)
-                    my_array[:].astype(mydtype).tofile(fid)
+        if pool is None:
+            for ar_name in array_names:
+                write_temporal_array_raw(
+                    f"{prefix}/{ar_name}.bin",
+                    sx,
+                    ar_name,
+                    time_indices,
+                    filtered_cells,
+                    reduce_precision,
+                )
+        else:
+            try:
+                results.get()
+            finally:
+                pool.terminate()
         print(f"done writing binary files in {prefix}")
+    return geometry.shape[0]
 
 
 def write_data(
@@ -291,6 +845,9 @@ def write_data(
     reduce_precision,
     backend,
     compression_level,
+    codec="gzip",
+    shuffle=False,
+    chunks=None,
 ):
     if dictTime:
         time_indices = list(dictTime.values())
@@ -299,12 +856,9 @@ def write_data(
     if backend == "hdf5":
         import h5py
 
-        compression_options = {}
-        if compression_level:
-            compression_options = {
-                "compression": "gzip",
-                "compression_opts": compression_level,
-            }
+        compression_options = hdf5_compression_options(
+            codec, compression_level, shuffle
+        )
 
         with h5py.File(prefix + ".h5", "w") as h5f:
             for ar_name, my_array in dicDataNonTemporal.items():
@@ -312,15 +866,18 @@ def write_data(
             for ar_name, my_array in dictData.items():
                 if len(my_array.shape) == 1:
                     my_array = my_array[np.newaxis, :]
-                for i, idt in enumerate(time_indices):
-                    if i == 0:
-                        h5f.create_dataset(
-                            f"/{ar_name}",
-                            (len(time_indices), my_array.shape[1]),
-                            dtype=str(output_type(my_array, reduce_precision)),
-                            **compression_options,
-                        )
-                    h5f[f"/{ar_name}"][i, :] = my_array[idt, :]
+                shape = (len(time_indices), my_array.shape[1])
+                start = time.perf_counter()
+                dset = h5f.create_dataset(
+                    f"/{ar_name}",
+                    shape,
+                    dtype=str(output_type(my_array, reduce_precision)),
+                    **hdf5_chunk_options(chunks, shape),
+                    **compression_options,
+                )
+                # the selected time steps, written at once
+                dset[...] = my_array[time_indices, :]
+                report_hdf5_dataset(dset, time.perf_counter() - start)
         print(f"done writing {prefix}.h5")
     else:
         os.makedirs(prefix, exist_ok=True)
@@ -335,8 +892,7 @@ def write_data(
                 if not dictTime:
                     my_array[:].astype(mydtype).tofile(fid)
                 else:
-                    for i, idt in enumerate(time_indices):
-                        my_array[idt, :].astype(mydtype).tofile(fid)
+                    my_array[time_indices, :].astype(mydtype).tofile(fid)
         print(f"done writing binary files in {prefix}")
 
 
@@ -389,6 +945,10 @@ def write(
     reduce_precision=False,
     backend="hdf5",
     compression_level=4,
+    codec="gzip",
+    shuffle=False,
+    chunks=None,
+    shared_mesh=False,
 ):
     """
     Write hdf5/xdmf files output, readable by ParaView using SeisSol data
@@ -400,6 +960,11 @@ def write(
                for writing a puml mesh use an empty dictionnary
     reduce_precision: convert double to float and i64 to i32 if True
     backend: data format ("hdf5" or "raw")
+    compression_level: compression level of gzip (0 for no compression)
+    codec: compression of the hdf5 datasets (see hdf5_compression_options)
+    shuffle: byte-shuffle the data before compression
+    chunks: chunk shape (time steps, cells) of the hdf5 datasets (h5py default if None)
+    shared_mesh: define the mesh once in the xdmf file, each time step referencing it
     """
     nNodes = xyz.shape[0]
     nCells, node_per_element = connect.shape
@@ -451,6 +1016,7 @@ def write(
             dictTime.keys(),
             reduce_precision,
             backend,
+            shared_mesh,
         )
 
     write_data(
@@ -461,9 +1027,199 @@ def write(
         reduce_precision,
         backend,
         compression_level,
+        codec,
+        shuffle,
+        chunks,
     )
 
 
+class TimeSeriesWriter:
+    """
+    Write hdf5/xdmf (or raw/xdmf) files output, readable by ParaView, time step
+    after time step, only holding one time step in memory: the hdf5 datasets are
+    resizable and chunked, the raw files are appended to, and the xdmf file is
+    updated after each time step (rewriting its tail), so that it can be read
+    while being written
+    prefix: file
+    xyz: geometry array
+    connect: connect array
+    non_temporal_data: dictionnary with names of known_1d_arrays (e.g. partition)
+                       as keys and 1d numpy arrays as values
+    reduce_precision: convert double to float and i64 to i32 if True
+    backend: data format ("hdf5" or "raw")
+    compression_level, codec, shuffle: compression (see write)
+    chunks: chunk shape (time steps, cells) of the hdf5 datasets
+    shared_mesh: define the mesh once in the xdmf file, each time step referencing it
+    usage:
+    with TimeSeriesWriter(prefix, xyz, connect) as writer:
+        for time, SRs in ...:
+            writer.append_step(time, {"SRs": SRs})
+    """
+
+    def __init__(
+        self,
+        prefix,
+        xyz,
+        connect,
+        non_temporal_data=None,
+        reduce_precision=False,
+        backend="hdf5",
+        compression_level=4,
+        codec="gzip",
+        shuffle=False,
+        chunks=None,
+        shared_mesh=False,
+    ):
+        if backend not in ("hdf5", "raw"):
+            raise ValueError(f"Invalid backend {backend}. Must be 'hdf5' or 'raw'.")
+        if compression_level < 0 or compression_level > 9:
+            raise ValueError("compression_level has to be in 0-9")
+        non_temporal_data = dict(non_temporal_data or {})
+        for name in non_temporal_data:
+            if name not in known_1d_arrays:
+                raise ValueError(f"{name} is not one of {known_1d_arrays}")
+        self.prefix = prefix
+        self.reduce_precision = reduce_precision
+        self.backend = backend
+        self.chunks = chunks
+        self.shared_mesh = shared_mesh
+        self.nNodes = xyz.shape[0]
+        self.nCells, self.node_per_element = connect.shape
+        self.n_steps = 0
+        self.dictDataTypes = compile_dictDataTypes(non_temporal_data, reduce_precision)
+        self.temporal_names = None
+        # geometry and connect are described with precision 8 in the xdmf file
+        arrays = {
+            "geometry": np.asarray(xyz, dtype=np.float64),
+            "connect": np.asarray(connect, dtype=np.int64),
+        }
+        for name, my_array in non_temporal_data.items():
+            arrays[name] = my_array.astype(output_type(my_array, reduce_precision))
+        if backend == "hdf5":
+            import h5py
+
+            self.compression_options = hdf5_compression_options(
+                codec, compression_level, shuffle
+            )
+            self.h5f = h5py.File(prefix + ".h5", "w")
+            for name, my_array in arrays.items():
+                write_one_arr_hdf5(self.h5f, name, my_array, self.compression_options)
+        else:
+            os.makedirs(prefix, exist_ok=True)
+            for name, my_array in arrays.items():
+                with open(f"{prefix}/{name}.bin", "wb") as fid:
+                    my_array.tofile(fid)
+            self.raw_files = {}
+        self.xdmf = open(prefix + ".xdmf", "w")
+        self.xdmf.write(
+            timeseries_xdmf_header(
+                prefix,
+                self.nNodes,
+                self.nCells,
+                self.node_per_element,
+                backend,
+                shared_mesh,
+            )
+        )
+        self.write_xdmf_tail("")
+
+    def write_xdmf_tail(self, text):
+        """append text to the xdmf file, followed by its footer, which
+        is overwritten by the next call"""
+        self.xdmf.write(text)
+        self.xdmf_end = self.xdmf.tell()
+        self.xdmf.write(timeseries_xdmf_footer)
+        self.xdmf.truncate()
+        self.xdmf.flush()
+        self.xdmf.seek(self.xdmf_end)
+
+    def create_arrays(self, dictData):
+        """define the time dependent arrays from the first time step"""
+        self.temporal_names = list(dictData.keys())
+        self.dictDataTypes.update(
+            compile_dictDataTypes(dictData, self.reduce_precision)
+        )
+        self.dtypes = {
+            name: np.dtype(output_type(my_array, self.reduce_precision))
+            for name, my_array in dictData.items()
+        }
+        for name, mydtype in self.dtypes.items():
+            if self.backend == "hdf5":
+                n_steps_chunk, n_cells_chunk = self.chunks or (
+                    1,
+                    2**20 // mydtype.itemsize,
+                )
+                self.h5f.create_dataset(
+                    f"/{name}",
+                    (0, self.nCells),
+                    maxshape=(None, self.nCells),
+                    dtype=mydtype,
+                    chunks=(n_steps_chunk, max(1, min(n_cells_chunk, self.nCells))),
+                    **self.compression_options,
+                )
+            else:
+                self.raw_files[name] = open(f"{self.prefix}/{name}.bin", "wb")
+
+    def append_step(self, time, dictData):
+        """write the time step at time of the arrays of dictData
+        (dataname as keys and arrays of shape (nCells) as values),
+        all time steps having the same datanames"""
+        if self.temporal_names is None:
+            self.create_arrays(dictData)
+        elif sorted(dictData.keys()) != sorted(self.temporal_names):
+            raise ValueError(
+                f"time step with {list(dictData.keys())},"
+                f" expected {self.temporal_names}"
+            )
+        i = self.n_steps
+        for name in self.temporal_names:
+            my_array = np.asarray(dictData[name]).reshape(-1)
+            if my_array.size != self.nCells:
+                raise ValueError(
+                    f"{name} has {my_array.size} values, expected {self.nCells}"
+                )
+            if self.backend == "hdf5":
+                dset = self.h5f[name]
+                dset.resize(i + 1, axis=0)
+                dset[i, :] = my_array
+            else:
+                my_array.astype(self.dtypes[name]).tofile(self.raw_files[name])
+                self.raw_files[name].flush()
+        if self.backend == "hdf5":
+            self.h5f.flush()
+        self.n_steps += 1
+        self.write_xdmf_tail(
+            timeseries_xdmf_step(
+                self.prefix,
+                i,
+                time,
+                self.nNodes,
+                self.nCells,
+                self.node_per_element,
+                self.dictDataTypes,
+                self.backend,
+                self.shared_mesh,
+            )
+        )
+
+    def close(self):
+        if self.xdmf.closed:
+            return
+        self.xdmf.close()
+        if self.backend == "hdf5":
+            self.h5f.close()
+        else:
+            for fid in self.raw_files.values():
+                fid.close()
+        print(f"done writing {self.n_steps} time steps in {self.prefix}.xdmf")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
 def write_from_seissol_output(
     prefix,
     sx,
@@ -473,6 +1229,14 @@ def write_from_seissol_output(
     backend="hdf5",
     compression_level=4,
     filtered_cells=slice(None),
+    cell_major=False,
+    codec="gzip",
+    shuffle=False,
+    chunks=None,
+    compression_threads=None,
+    shared_mesh=False,
+    compact_mesh=True,
+    n_processes=1,
 ):
     """
     Write hdf5/xdmf files output, readable by ParaView from a seissolxdmf object
@@ -482,9 +1246,21 @@ def write_from_seissol_output(
     time_indices: list of times indices to extract
     reduce_precision: convert double to float and i64 to i32 if True
     backend: data format ("hdf5" or "raw")
+    cell_major: store the arrays in hdf5 chunks spanning all time steps of a few cells,
+                for fast access to the time series of cells (hdf5 only)
+    codec: compression of the hdf5 datasets (see hdf5_compression_options)
+    shuffle: byte-shuffle the data before compression
+    chunks: chunk shape (time steps, cells) of the hdf5 datasets (h5py default if None)
+    compression_threads: number of threads compressing with gzip (number of cores if None)
+    shared_mesh: define the mesh once in the xdmf file, each time step referencing it
+    compact_mesh: if cells are filtered, only write the vertices of the filtered cells
+    n_processes: number of worker processes writing the variables (or blocks of
+                 time steps) in parallel (see write_data_from_seissolxdmf)
     """
     if backend not in ("hdf5", "raw"):
         raise ValueError(f"Invalid backend {backend}. Must be 'hdf5' or 'raw'.")
+    if cell_major and backend != "hdf5":
+        raise ValueError("cell_major requires the hdf5 backend")
     if compression_level < 0 or compression_level > 9:
         raise ValueError("compression_level has to be in 0-9")
 
@@ -505,7 +1281,7 @@ def write_from_seissol_output(
         data_prec = 4 if reduce_precision else data_prec
         dictDataTypes[name] = (data_prec, "Float")
 
-    write_data_from_seissolxdmf(
+    nNodes = write_data_from_seissolxdmf(
         prefix,
         sx,
         non_temporal_array_names,
@@ -515,10 +1291,16 @@ def write_from_seissol_output(
         backend,
         compression_level,
         filtered_cells,
+        cell_major,
+        codec,
+        shuffle,
+        chunks,
+        compression_threads,
+        compact_mesh,
+        n_processes,
     )
 
     nel = infer_n_elements(sx, filtered_cells)
-    nNodes = sx.ReadNNodes()
     node_per_element = sx.ReadNodesPerElement()
     dictTime = [sx.ReadTimes()[k] for k in time_indices]
 
@@ -542,4 +1324,138 @@ def write_from_seissol_output(
             dictTime,
             reduce_precision,
             backend,
+            shared_mesh,
         )
+
+
+def write_stations_from_seissol_output(
+    prefix,
+    sx,
+    var_names,
+    time_indices,
+    stations,
+    interpolation="barycentric",
+    reduce_precision=False,
+    compression_level=4,
+    spatial_index=None,
+    codec="gzip",
+    shuffle=False,
+):
+    """
+    Write the time series of variables at stations into a hdf5 file from a seissolxdmf object
+    only the cells required for the interpolation at the stations are read
+    prefix: file (prefix.h5 is written)
+    sx: seissolxdmf object
+    var_names: list of variables to extract
+    time_indices: list of times indices to extract
+    stations: array of station coordinates, of shape (nstations, 3)
+    interpolation: "barycentric" or "cell" (see seissolxdmf.GetStationInterpolator)
+    reduce_precision: convert double to float if True
+    spatial_index: spatial index of the cells of sx (see seissolxdmf.GetSpatialIndex)
+    codec, shuffle: compression of the hdf5 datasets (see hdf5_compression_options)
+    The file contains the station coordinates (xyz), the output times (time)
+    and an array of shape (nstations, len(time_indices)) per variable
+    """
+    import h5py
+
+    if compression_level < 0 or compression_level > 9:
+        raise ValueError("compression_level has to be in 0-9")
+    compression_options = hdf5_compression_options(codec, compression_level, shuffle)
+
+    stations = np.atleast_2d(np.asarray(stations, dtype=np.float64))
+    interpolator = sx.GetStationInterpolator(stations, interpolation, spatial_index)
+    print(
+        f"{len(interpolator.cells)} cells read for {len(stations)} stations"
+        f" ({sx.ReadNElements()} cells in the mesh)"
+    )
+    times = np.array([sx.ReadTimes()[k] for k in time_indices])
+    with h5py.File(prefix + ".h5", "w") as h5f:
+        write_one_arr_hdf5(h5f, "xyz", stations, {})
+        write_one_arr_hdf5(h5f, "time", times, {})
+        for ar_name in tqdm(var_names, file=sys.stdout, dynamic_ncols=False):
+            my_array = sx.ReadStationData(ar_name, interpolator, time_indices)
+            my_array = my_array.astype(output_type(my_array, reduce_precision))
+            write_one_arr_hdf5(h5f, ar_name, my_array, compression_options)
+    print(f"done writing {prefix}.h5")
+
+
+def write_reduced_from_seissol_output(
+    prefix,
+    sx,
+    var_names,
+    time_indices,
+    reduction,
+    window=None,
+    reduce_precision=False,
+    backend="hdf5",
+    compression_level=4,
+    filtered_cells=slice(None),
+    codec="gzip",
+    shuffle=False,
+    shared_mesh=False,
+    compact_mesh=True,
+):
+    """
+    Write hdf5/xdmf files output, readable by ParaView, of variables reduced over time
+    (e.g. peak slip rate or PGV maps), streaming through the time steps in a single pass
+    prefix: file
+    sx: seissolxdmf object
+    var_names: list of variables to extract, reduced variables being named
+               {name}_{reduction} (e.g. SR_max)
+    time_indices: list of times indices to reduce
+    reduction: max, min, absmax, mean, argmax or argmin (see seissolxdmf.TemporalReduction),
+               argmax and argmin giving the time of the extremum
+    window: number of time steps reduced in each output time step (the last one
+            possibly shorter), labelled with the time of their last step.
+            All time steps are reduced into a single one if None
+    other arguments: see write_from_seissol_output
+    """
+    from seissolxdmf import TemporalReduction
+
+    if reduction not in ["max", "min", "absmax", "mean", "argmax", "argmin"]:
+        raise ValueError(f"unsupported reduction {reduction}")
+    time_indices = list(time_indices)
+    if not time_indices:
+        raise ValueError("no time step to reduce")
+    window = window or len(time_indices)
+    if window < 1:
+        raise ValueError("window has to be positive")
+    windows = [
+        time_indices[i : i + window] for i in range(0, len(time_indices), window)
+    ]
+
+    non_temporal_data = {
+        name: sx.Read1dData(name, sx.nElements, isInt=True)[filtered_cells]
+        for name in var_names
+        if name in known_1d_arrays
+    }
+    var_names = [name for name in var_names if name not in known_1d_arrays]
+    times = np.asarray(sx.ReadTimes())
+    cells = None if is_unfiltered(filtered_cells) else filtered_cells
+    xyz, connect = read_mesh(sx, filtered_cells, compact_mesh)
+
+    with TimeSeriesWriter(
+        prefix,
+        xyz,
+        connect,
+        non_temporal_data,
+        reduce_precision,
+        backend,
+        compression_level,
+        codec,
+        shuffle,
+        shared_mesh=shared_mesh,
+    ) as writer:
+        for steps in tqdm(windows, file=sys.stdout, dynamic_ncols=False):
+            dictData = {}
+            for ar_name in var_names:
+                my_reduction = TemporalReduction(reduction, steps, times[steps])
+                for idt, my_array in sx.IterTimeSteps(
+                    ar_name, steps, cells, fillValue=np.nan
+                ):
+                    my_reduction.Update(my_array)
+                my_array = my_reduction.Result()
+                if reduction in ["argmax", "argmin"]:
+                    my_array = times[my_array]
+                dictData[f"{ar_name}_{reduction}"] = my_array
+            writer.append_step(times[steps[-1]], dictData)